@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm
 from .models import CustomUser,Book,Borrow,Favorite
+from .api.book_counters import recount_books
+from .api.changes import availability_change, changes_for, record
 # Register your models here.
 
 class CustomUserCreationForm(UserCreationForm):
@@ -32,7 +34,35 @@ class CustomUserAdmin(UserAdmin):
     ordering = ('email',)
     
     
+class VersionedAdmin(admin.ModelAdmin):
+    """
+    Admin edits of loans and favorites are logged for delta sync and bump the
+    version keys behind the list ETags, and the counters of the books they
+    touch are recomputed; the API views do both for their own writes.
+    """
+    def save_model(self, request, obj, form, change):
+        # The book the row pointed at before, in case the edit moved it
+        book_ids = set(type(obj).objects.filter(pk=obj.pk).values_list('book_id', flat=True)) if change else set()
+        super().save_model(request, obj, form, change)
+        recount_books(book_ids | {obj.book_id})
+        record(*changes_for(obj), *[availability_change(book_id) for book_id in book_ids | {obj.book_id}])
+
+    def delete_model(self, request, obj):
+        changes = changes_for(obj, deleted=True)
+        super().delete_model(request, obj)
+        recount_books({obj.book_id})
+        record(*changes, availability_change(obj.book_id))
+
+    def delete_queryset(self, request, queryset):
+        objs = list(queryset)
+        changes = [change for obj in objs for change in changes_for(obj, deleted=True)]
+        book_ids = {obj.book_id for obj in objs}
+        super().delete_queryset(request, queryset)
+        recount_books(book_ids)
+        record(*changes, *[availability_change(book_id) for book_id in book_ids])
+
+
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Book)
-admin.site.register(Borrow)
-admin.site.register(Favorite)
\ No newline at end of file
+admin.site.register(Borrow, VersionedAdmin)
+admin.site.register(Favorite, VersionedAdmin)
\ No newline at end of file
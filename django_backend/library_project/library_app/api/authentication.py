@@ -0,0 +1,33 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .object_cache import object_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user id claim through the
+    object cache instead of querying the user table on every request. The
+    cached user is dropped whenever the user is saved, so deactivation,
+    staff changes and password changes apply at once; checks are the same
+    as JWTAuthentication's. The password hash is never cached: the revoke
+    check compares against the cached hash of it instead.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from exc
+
+        user = object_cache.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user.token_version:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
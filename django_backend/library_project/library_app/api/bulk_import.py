@@ -0,0 +1,95 @@
+import csv
+import re
+from itertools import islice
+
+from library_app.models import Book
+from .google_books import ISBN_RE, lookup_many
+from .search import index_books
+from .changes import book_change, record
+from .stats import activity, count_activity
+
+
+def clean_isbn(value):
+    # Hyphens and spaces dropped, and a lower-case X check digit raised
+    return re.sub(r'[\s-]', '', value).upper()
+
+
+def parse_isbn_lines(lines):
+    """
+    Read ISBNs from a CSV or newline-delimited stream. The first column is
+    the ISBN, an optional second column the quantity; a header row is skipped.
+    Yields (isbn, quantity) with quantity None when absent or unreadable.
+    """
+    for row in csv.reader(line.decode('utf-8') if isinstance(line, bytes) else line for line in lines):
+        if not row or not row[0].strip() or row[0].strip().lower() == 'isbn':
+            continue
+        isbn = clean_isbn(row[0])
+        quantity = None
+        if len(row) > 1 and row[1].strip().isdigit():
+            quantity = int(row[1])
+        yield isbn, quantity
+
+
+def import_isbns(lines, quantity=1, batch_size=500, workers=8):
+    """
+    Create books for a stream of ISBNs, batch by batch, and yield one result
+    dict per input row. Only one batch is held in memory at a time.
+    """
+    entries = parse_isbn_lines(lines)
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            return
+        yield from _import_batch(batch, quantity, workers)
+
+
+def _import_batch(batch, default_quantity, workers):
+    results = []
+    pending = {}
+    for isbn, quantity in batch:
+        if not ISBN_RE.match(isbn):
+            results.append({'isbn': isbn, 'status': 'invalid'})
+        elif isbn in pending:
+            results.append({'isbn': isbn, 'status': 'duplicate'})
+        else:
+            pending[isbn] = quantity if quantity is not None else default_quantity
+
+    existing = set(Book.objects.filter(isbn__in=pending).values_list('isbn', flat=True))
+    for isbn in existing:
+        results.append({'isbn': isbn, 'status': 'exists'})
+        del pending[isbn]
+
+    book_infos, errors = lookup_many(pending, workers=workers) if pending else ({}, {})
+
+    books = []
+    for isbn, quantity in pending.items():
+        if isbn in errors:
+            results.append({'isbn': isbn, 'status': 'error', 'message': str(errors[isbn])})
+            continue
+        book_info = book_infos.get(isbn)
+        if not book_info:
+            results.append({'isbn': isbn, 'status': 'not_found'})
+            continue
+        book = Book(isbn=isbn, quantity=quantity)
+        book.apply_book_info(book_info)
+        books.append(book)
+
+    # An import racing this one on the same ISBN is skipped rather than failing
+    # the stream midway. Only ISBNs missing before the insert and present after
+    # it are ours; the ids are read back, as not every backend returns them
+    taken = set(Book.objects.filter(isbn__in=[book.isbn for book in books]).values_list('isbn', flat=True))
+    books = [book for book in books if book.isbn not in taken]
+    Book.objects.bulk_create(books, ignore_conflicts=True)
+    saved = {book.isbn: book for book in Book.objects.filter(isbn__in=[book.isbn for book in books])}
+    # bulk_create skips post_save, so index the new rows explicitly
+    index_books(list(saved.values()))
+    record(*[book_change(book.id) for book in saved.values()])
+    count_activity(activity(new_books=len(saved)))
+    for isbn in sorted(taken):
+        results.append({'isbn': isbn, 'status': 'exists'})
+    for book in books:
+        if book.isbn in saved:
+            results.append({'isbn': book.isbn, 'status': 'created', 'title': book.title, 'quantity': book.quantity})
+        else:
+            results.append({'isbn': book.isbn, 'status': 'error', 'message': 'The book could not be saved.'})
+    return results
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from library_app.models import Book, Borrow, ChangeLogEntry, Favorite
+from .live import publish_availability
+from .object_cache import book_key, object_cache
+from .versions import CATALOG, book_version_key, borrows_key, bump, favorites_key
+
+# Default settings, overridable through settings.SYNC
+DEFAULTS = {
+    # Seconds a missing log id holds back the sync token before it counts as rolled back
+    'GAP_TIMEOUT': 30,
+}
+
+
+def sync_setting(name):
+    return getattr(settings, 'SYNC', {}).get(name, DEFAULTS[name])
+
+
+def book_change(book_id, deleted=False):
+    return ChangeLogEntry(kind=ChangeLogEntry.BOOK, object_id=book_id, deleted=deleted)
+
+
+def availability_change(book_id):
+    # A book change that only moved its stock or counters (a loan, a favorite):
+    # logged like any other, but it leaves the catalog version alone
+    change = book_change(book_id)
+    change.catalog = False
+    return change
+
+
+def borrow_change(borrow_id, user_id, deleted=False):
+    return ChangeLogEntry(kind=ChangeLogEntry.BORROW, object_id=borrow_id, user_id=user_id, deleted=deleted)
+
+
+def favorite_change(book_id, user_id, deleted=False):
+    return ChangeLogEntry(kind=ChangeLogEntry.FAVORITE, object_id=book_id, user_id=user_id, deleted=deleted)
+
+
+def changes_for(instance, deleted=False):
+    # The log entries for a saved or deleted model instance
+    if isinstance(instance, Book):
+        return [book_change(instance.pk, deleted)]
+    if isinstance(instance, Borrow):
+        return [borrow_change(instance.pk, instance.user_id, deleted)]
+    if isinstance(instance, Favorite):
+        return [favorite_change(instance.book_id, instance.user_id, deleted)]
+    return []
+
+
+def version_keys(change):
+    if change.kind == ChangeLogEntry.BORROW:
+        return [borrows_key(change.user_id)]
+    if change.kind == ChangeLogEntry.FAVORITE:
+        return [favorites_key(change.user_id)]
+    return [book_version_key(change.object_id)] + ([CATALOG] if change.catalog else [])
+
+
+def cache_key(change):
+    # The object cache entry a change makes stale
+    if change.kind == ChangeLogEntry.BOOK:
+        return book_key(change.object_id)
+    return version_keys(change)[0]
+
+
+def record(*changes):
+    """
+    Append changes to the log read by /sync/ and bump the version keys they
+    touch, so delta sync and the list ETags always move together; only
+    catalog changes bump the one catalog key every writer would share. The
+    cached rows they touch are dropped now and again on commit, so a reader
+    racing the transaction cannot leave a stale copy behind. Book changes
+    are pushed to live availability streams once committed.
+    """
+    if not changes:
+        return
+    ChangeLogEntry.objects.bulk_create(changes)
+    bump(*[key for change in changes for key in version_keys(change)])
+    cache_keys = list(dict.fromkeys(cache_key(change) for change in changes))
+    object_cache.invalidate(*cache_keys)
+    transaction.on_commit(partial(object_cache.invalidate, *cache_keys))
+    book_ids = {change.object_id for change in changes if change.kind == ChangeLogEntry.BOOK}
+    if book_ids:
+        transaction.on_commit(partial(publish_availability, book_ids))
+
+
+def changes_since(user, since, limit):
+    """
+    The log entries after token `since` visible to `user` (catalog entries and
+    the user's own), oldest first. Both halves are ranges on the (user, id)
+    index, so the cost follows the number of changes, not the table sizes.
+    Entries get their ids inside the writers' transactions and can commit out
+    of order, so nothing past a missing id is sent until it shows up or
+    GAP_TIMEOUT passes; has_more is then false and the client comes back later.
+    """
+    catalog = ChangeLogEntry.objects.filter(user__isnull=True, id__gt=since).order_by('id')[:limit + 1]
+    own = ChangeLogEntry.objects.filter(user=user, id__gt=since).order_by('id')[:limit + 1]
+    entries = sorted(list(catalog) + list(own), key=lambda entry: entry.id)
+    entries, has_more = entries[:limit], len(entries) > limit
+    if entries:
+        horizon = settled_horizon(since, entries[-1].id)
+        if horizon < entries[-1].id:
+            entries, has_more = [entry for entry in entries if entry.id <= horizon], False
+    return entries, has_more
+
+
+def settled_horizon(since, last):
+    """
+    The highest id up to `last` below which no id may still commit. A missing
+    id is settled once an entry above it is GAP_TIMEOUT old: its insert came
+    first, so it was rolled back. Only the recent entries and the first old one
+    below them are read, newest first.
+    """
+    cutoff = timezone.now() - timedelta(seconds=sync_setting('GAP_TIMEOUT'))
+    present = set()
+    floor = since
+    rows = ChangeLogEntry.objects.filter(id__gt=since, id__lte=last).order_by('-id').values_list('id', 'created_at')
+    for row_id, created_at in rows.iterator(chunk_size=100):
+        present.add(row_id)
+        if created_at < cutoff:
+            floor = row_id
+            break
+    for row_id in range(floor + 1, last + 1):
+        if row_id not in present:
+            return row_id - 1
+    return last
+
+
+def latest_states(entries):
+    # Collapse the entries to the last write per object: {kind: {object_id: deleted}}
+    states = {ChangeLogEntry.BOOK: {}, ChangeLogEntry.BORROW: {}, ChangeLogEntry.FAVORITE: {}}
+    for entry in entries:
+        states[entry.kind][entry.object_id] = entry.deleted
+    return states
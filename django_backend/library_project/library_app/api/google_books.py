@@ -0,0 +1,535 @@
+import asyncio
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import timedelta
+from urllib.parse import urlparse
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from library_app.models import GoogleBookCache
+from .metrics import track_http
+
+try:
+    import httpx
+except ImportError:  # optional; the async client falls back to the pooled session on a worker thread
+    httpx = None
+
+# A normalized ISBN-10 or ISBN-13; see bulk_import.clean_isbn
+ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+
+# Default settings, overridable through settings.GOOGLE_BOOKS
+DEFAULTS = {
+    'API_URL': 'https://www.googleapis.com/books/v1/volumes',
+    # Read timeout; CONNECT_TIMEOUT bounds the TCP/TLS handshake on its own
+    'TIMEOUT': 5,
+    'CONNECT_TIMEOUT': 3.05,
+    'POOL_SIZE': 10,
+    # ISBNs per `isbn:A OR isbn:B` query
+    'BATCH_SIZE': 10,
+    # Consecutive upstream failures that open the circuit, and seconds before a trial call
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET': 30,
+    'CACHE_TTL': timedelta(days=7),
+    'NEGATIVE_CACHE_TTL': timedelta(days=1),
+    'STALE_TTL': timedelta(days=30),
+    'LRU_SIZE': 2048,
+    'RATE_LIMIT': 10,
+    'MAX_RETRIES': 3,
+    'BACKOFF_FACTOR': 0.5,
+}
+
+
+def google_books_setting(name):
+    return getattr(settings, 'GOOGLE_BOOKS', {}).get(name, DEFAULTS[name])
+
+
+def request_timeout():
+    return (google_books_setting('CONNECT_TIMEOUT'), google_books_setting('TIMEOUT'))
+
+
+def normalize_volume_info(volume_info):
+    # Keep only the fields the app uses from a Google Books volumeInfo
+    return {
+        'title': volume_info.get('title', ''),
+        'author': volume_info.get('authors', []),
+        'publisher': volume_info.get('publisher', ''),
+        'publishedDate': volume_info.get('publishedDate', ''),
+        'description': volume_info.get('description', ''),
+        'cover_image': volume_info.get('imageLinks', {}).get('thumbnail', ''),
+    }
+
+
+class GoogleBooksError(Exception):
+    """Raised when Google Books could not be reached or answered with an error."""
+
+
+class CircuitOpenError(GoogleBooksError):
+    """Raised without calling Google Books while the circuit breaker is open."""
+
+
+class RateLimiter:
+    """Token bucket per host, shared by all the threads of a fetch pool."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if not self.rate:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=10):
+    # Pooled keep-alive session that retries throttled and failed requests with backoff
+    retry = Retry(
+        total=google_books_setting('MAX_RETRIES'),
+        backoff_factor=google_books_setting('BACKOFF_FACTOR'),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def query_volumes(params, session=requests, rate_limiter=None):
+    # One GET of the volumes endpoint, returning the decoded body
+    url = google_books_setting('API_URL')
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    try:
+        with track_http():
+            response = session.get(url, params=params, timeout=request_timeout())
+    except requests.RequestException as exc:
+        raise GoogleBooksError(str(exc)) from exc
+
+    if response.status_code != 200:
+        raise GoogleBooksError(f'Google Books answered {response.status_code}')
+    return response.json()
+
+
+def first_volume(data):
+    # The normalized info of the first volume of a single-ISBN query, or None
+    if data.get('items'):
+        return normalize_volume_info(data['items'][0]['volumeInfo'])
+    return None
+
+
+def fetch_book_info(isbn, session=requests, rate_limiter=None):
+    # Query Google Books; returns the normalized info, or None when there is no match
+    return first_volume(query_volumes({'q': f'isbn:{isbn}'}, session, rate_limiter))
+
+
+def fetch_book_infos(isbns, session=requests, rate_limiter=None):
+    """
+    Look up several ISBNs with one `isbn:A OR isbn:B` query, matching the
+    volumes back through their industryIdentifiers. ISBNs the batch did not
+    match are asked for one by one, so a partial answer is never taken for
+    "not found". Returns {isbn: info or None}.
+    """
+    if len(isbns) == 1:
+        return {isbns[0]: fetch_book_info(isbns[0], session, rate_limiter)}
+    data = query_volumes(
+        {'q': ' OR '.join(f'isbn:{isbn}' for isbn in isbns), 'maxResults': 40},
+        session,
+        rate_limiter,
+    )
+    wanted = set(isbns)
+    results = {}
+    for item in data.get('items', []):
+        volume_info = item.get('volumeInfo', {})
+        for identifier in volume_info.get('industryIdentifiers', []):
+            isbn = identifier.get('identifier')
+            if isbn in wanted and isbn not in results:
+                results[isbn] = normalize_volume_info(volume_info)
+    for isbn in isbns:
+        if isbn not in results:
+            results[isbn] = fetch_book_info(isbn, session, rate_limiter)
+    return results
+
+
+class CircuitBreaker:
+    """
+    Fails fast once Google Books has failed BREAKER_THRESHOLD times in a
+    row. After BREAKER_RESET seconds one trial call goes through: success
+    closes the circuit, failure opens it again. "Not found" is a success.
+    """
+
+    def __init__(self, threshold=None, reset_after=None, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            reset_after = self.reset_after if self.reset_after is not None else google_books_setting('BREAKER_RESET')
+            if not self._trial and self.clock() - self._opened_at >= reset_after:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        threshold = self.threshold if self.threshold is not None else google_books_setting('BREAKER_THRESHOLD')
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= threshold:
+                self._opened_at = self.clock()
+                self._trial = False
+
+    def call(self, func, *args):
+        if not self.allow():
+            raise CircuitOpenError('Google Books circuit is open')
+        succeeded = False
+        try:
+            result = func(*args)
+            succeeded = True
+            return result
+        finally:
+            # Any exception counts as a failure, so a trial call always settles the circuit
+            self.success() if succeeded else self.failure()
+
+
+class SingleFlight:
+    """Concurrent calls for the same key share the first caller's result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func(*args)
+            return call['result']
+        except Exception as exc:
+            call['error'] = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+class GoogleBooksClient:
+    """
+    The process-wide way to call Google Books: a pooled keep-alive session
+    with connect/read timeouts, behind a circuit breaker, with concurrent
+    lookups of one ISBN coalesced into a single upstream request.
+    """
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or CircuitBreaker()
+        self._flights = SingleFlight()
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = make_session(google_books_setting('POOL_SIZE'))
+            return self._session
+
+    def fetch(self, isbn, rate_limiter=None):
+        return self._flights.do(isbn, self.breaker.call, fetch_book_info, isbn, self.session, rate_limiter)
+
+    def fetch_many(self, isbns, rate_limiter=None):
+        # Batched lookup; one breaker call per batch
+        return self.breaker.call(fetch_book_infos, list(isbns), self.session, rate_limiter)
+
+
+class AsyncGoogleBooksClient:
+    """
+    GoogleBooksClient for async code, sharing its circuit breaker. Lookups
+    of one ISBN in flight on an event loop are coalesced. Requests go over
+    a pooled httpx.AsyncClient per loop when httpx is installed, otherwise
+    through the sync client's session on a worker thread.
+    """
+
+    def __init__(self, sync_client):
+        self.sync_client = sync_client
+        self.breaker = sync_client.breaker
+        self._inflight = weakref.WeakKeyDictionary()
+        self._http = weakref.WeakKeyDictionary()
+
+    async def fetch(self, isbn):
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.setdefault(loop, {})
+        task = inflight.get(isbn)
+        if task is None:
+            task = inflight[isbn] = loop.create_task(self._fetch(isbn))
+            task.add_done_callback(lambda _: inflight.pop(isbn, None))
+        # A cancelled caller must not cancel the lookup the others wait on
+        return await asyncio.shield(task)
+
+    async def aclose(self):
+        # Close the httpx pool of the running loop
+        http = self._http.pop(asyncio.get_running_loop(), None)
+        if http is not None:
+            await http.aclose()
+
+    async def _fetch(self, isbn):
+        if not self.breaker.allow():
+            raise CircuitOpenError('Google Books circuit is open')
+        succeeded = False
+        try:
+            if httpx is None:
+                info = await sync_to_async(fetch_book_info, thread_sensitive=False)(isbn, self.sync_client.session)
+            else:
+                info = first_volume(await self._get({'q': f'isbn:{isbn}'}))
+            succeeded = True
+            return info
+        finally:
+            self.breaker.success() if succeeded else self.breaker.failure()
+
+    async def _get(self, params):
+        loop = asyncio.get_running_loop()
+        http = self._http.get(loop)
+        if http is None:
+            connect, read = request_timeout()
+            pool_size = google_books_setting('POOL_SIZE')
+            http = self._http[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        with track_http():
+            try:
+                response = await http.get(google_books_setting('API_URL'), params=params)
+            except httpx.HTTPError as exc:
+                raise GoogleBooksError(str(exc)) from exc
+        if response.status_code != 200:
+            raise GoogleBooksError(f'Google Books answered {response.status_code}')
+        return response.json()
+
+
+client = GoogleBooksClient()
+async_client = AsyncGoogleBooksClient(client)
+
+
+class BookInfoCache:
+    """
+    Two-tier cache in front of Google Books: an in-process LRU backed by the
+    GoogleBookCache table. Misses are cached too (negative caching), and
+    expired entries are served while a background refresh runs.
+    """
+
+    def __init__(self, fetcher=None, background=True):
+        self.fetcher = fetcher or client.fetch
+        self.background = background
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stale': 0, 'errors': 0}
+
+    def get(self, isbn, raise_errors=False):
+        # Anything else would only fill the cache table with junk keys
+        if not isinstance(isbn, str) or not ISBN_RE.match(isbn):
+            return None
+        now = timezone.now()
+        entry = self._memory_get(isbn)
+        if entry is None:
+            entry = self._db_get(isbn)
+            if entry is not None:
+                self._count('db_hits')
+                self._memory_set(isbn, entry)
+        else:
+            self._count('memory_hits')
+
+        if entry is not None:
+            info, found, fetched_at = entry
+            age = now - fetched_at
+            ttl = google_books_setting('CACHE_TTL') if found else google_books_setting('NEGATIVE_CACHE_TTL')
+            if age <= ttl:
+                return info
+            if age <= ttl + google_books_setting('STALE_TTL'):
+                # Serve the stale value and refresh it behind the request
+                self._count('stale')
+                self._schedule_refresh(isbn)
+                return info
+
+        self._count('misses')
+        try:
+            return self.refresh(isbn)
+        except GoogleBooksError:
+            self._count('errors')
+            # Upstream is down: an outdated answer beats no answer
+            if entry is not None:
+                return entry[0]
+            if raise_errors:
+                raise
+            return None
+
+    def refresh(self, isbn):
+        info = self.fetcher(isbn)
+        entry = (info, info is not None, timezone.now())
+        GoogleBookCache.objects.update_or_create(
+            isbn=isbn,
+            defaults={'data': info, 'found': entry[1], 'fetched_at': entry[2]},
+        )
+        self._memory_set(isbn, entry)
+        return info
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _schedule_refresh(self, isbn):
+        with self._lock:
+            if isbn in self._refreshing:
+                return
+            self._refreshing.add(isbn)
+        if self.background:
+            threading.Thread(target=self._background_refresh, args=(isbn,), daemon=True).start()
+        else:
+            self._background_refresh(isbn, close_connections=False)
+
+    def _background_refresh(self, isbn, close_connections=True):
+        try:
+            self.refresh(isbn)
+        except GoogleBooksError:
+            self._count('errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(isbn)
+            if close_connections:
+                connection.close()
+
+    def _memory_get(self, isbn):
+        with self._lock:
+            entry = self._entries.get(isbn)
+            if entry is not None:
+                self._entries.move_to_end(isbn)
+            return entry
+
+    def _memory_set(self, isbn, entry):
+        with self._lock:
+            self._entries[isbn] = entry
+            self._entries.move_to_end(isbn)
+            while len(self._entries) > google_books_setting('LRU_SIZE'):
+                self._entries.popitem(last=False)
+
+    def _db_get(self, isbn):
+        row = GoogleBookCache.objects.filter(isbn=isbn).values_list('data', 'found', 'fetched_at').first()
+        return tuple(row) if row is not None else None
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+book_info_cache = BookInfoCache()
+
+
+def get_book_info_from_google(isbn, raise_errors=False):
+    return book_info_cache.get(isbn, raise_errors)
+
+
+def lookup_many(isbns, workers=8, rate_limiter=None, books_client=None):
+    """
+    Resolve many ISBNs at once: fresh GoogleBookCache rows are read in one
+    query, the rest are fetched in batched `OR` queries through a bounded
+    thread pool and written back in one batch. Requests go through the
+    shared GoogleBooksClient, so they count against its circuit breaker and
+    single lookups join any already in flight. Returns
+    ({isbn: info or None}, {isbn: error}).
+    """
+    books_client = books_client or client
+    isbns = list(dict.fromkeys(isbns))
+    now = timezone.now()
+    results = {}
+    for isbn, data, found, fetched_at in GoogleBookCache.objects.filter(isbn__in=isbns).values_list(
+        'isbn', 'data', 'found', 'fetched_at'
+    ):
+        ttl = google_books_setting('CACHE_TTL') if found else google_books_setting('NEGATIVE_CACHE_TTL')
+        if now - fetched_at <= ttl:
+            results[isbn] = data
+
+    missing = [isbn for isbn in isbns if isbn not in results]
+    if not missing:
+        return results, {}
+
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(google_books_setting('RATE_LIMIT'))
+
+    def fetch(batch):
+        try:
+            return books_client.fetch_many(batch, rate_limiter), {}
+        except CircuitOpenError as exc:
+            return {}, {isbn: exc for isbn in batch}
+        except GoogleBooksError as exc:
+            # A failed batch is retried ISBN by ISBN, so one bad ISBN fails alone
+            if len(batch) == 1:
+                return {}, {batch[0]: exc}
+            found, failed = {}, {}
+            for isbn in batch:
+                try:
+                    found[isbn] = books_client.fetch(isbn, rate_limiter)
+                except GoogleBooksError as exc:
+                    failed[isbn] = exc
+            return found, failed
+
+    batch_size = google_books_setting('BATCH_SIZE')
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+    errors = {}
+    fetched = []
+    # Each fetch runs in a copy of the caller's context, so its HTTP time counts against the request
+    contexts = [copy_context() for _ in batches]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for found, failed in executor.map(lambda batch, context: context.run(fetch, batch), batches, contexts):
+            errors.update(failed)
+            for isbn, info in found.items():
+                results[isbn] = info
+                fetched.append(GoogleBookCache(isbn=isbn, data=info, found=info is not None, fetched_at=timezone.now()))
+
+    GoogleBookCache.objects.bulk_create(
+        fetched,
+        update_conflicts=True,
+        unique_fields=['isbn'],
+        update_fields=['data', 'found', 'fetched_at'],
+    )
+    return results, errors
@@ -0,0 +1,88 @@
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps
+
+# Longest side, in pixels, of each rendition
+RENDITION_SIZES = {'small': 128, 'medium': 320, 'large': 640}
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 75, 'method': 4}),
+}
+
+
+def rendition_names(original_name, content):
+    # Content-hashed names next to the original, so a new upload never reuses stale files
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    directory, filename = posixpath.split(original_name)
+    stem = posixpath.splitext(filename)[0]
+    return {
+        size: {
+            fmt: posixpath.join(directory, f'{stem}.{digest}.{size}.{extension}')
+            for fmt, (extension, _) in FORMATS.items()
+        }
+        for size in RENDITION_SIZES
+    }
+
+
+def generate_renditions(field_file):
+    """
+    Write the small/medium/large JPEG and WebP renditions of an image field's
+    file to its storage and return {'original': name, size: {format: name}}.
+    Files that already exist under their content-hashed name are kept.
+    """
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as original:
+        content = original.read()
+    names = rendition_names(field_file.name, content)
+
+    image = None
+    for size, formats in names.items():
+        for fmt, name in formats.items():
+            if storage.exists(name):
+                continue
+            if image is None:
+                image = ImageOps.exif_transpose(Image.open(io.BytesIO(content))).convert('RGB')
+            resized = image.copy()
+            edge = RENDITION_SIZES[size]
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), **FORMATS[fmt][1])
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+    return {'original': field_file.name, **names}
+
+
+def renditions_are_current(field_file, renditions):
+    return bool(field_file) and bool(renditions) and renditions.get('original') == field_file.name
+
+
+def rendition_urls(field_file, renditions):
+    # {size: {format: url}} for the serializers, or None without a current rendition set
+    return rendition_urls_for(field_file.name if field_file else '', renditions, field_file.storage.url)
+
+
+def rendition_urls_for(name, renditions, url):
+    # rendition_urls() from a stored file name and a url(name) function, for .values() rows
+    if not name or not renditions or renditions.get('original') != name:
+        return None
+    return {
+        size: {fmt: url(rendition) for fmt, rendition in renditions[size].items()}
+        for size in RENDITION_SIZES
+    }
+
+
+def url_builder(storage):
+    """
+    storage.url as a function of the file name. For a FileSystemStorage the
+    base URL is joined by concatenation, which gives the same URLs without
+    the urljoin per call; other storages keep their own url().
+    """
+    if isinstance(storage, FileSystemStorage) and storage.base_url and storage.base_url.endswith('/'):
+        base_url = storage.base_url
+        return lambda name: base_url + filepath_to_uri(name).lstrip('/')
+    return storage.url
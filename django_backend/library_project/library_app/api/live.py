@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from library_app.models import Book
+
+# Default settings, overridable through settings.LIVE_UPDATES
+DEFAULTS = {
+    'BACKEND': 'library_app.api.live.LocalBroker',
+    'QUEUE_SIZE': 100,
+    'MAX_BOOKS': 200,
+    'HEARTBEAT': 15,
+    'MAX_DURATION': 300,
+}
+
+# The Book columns an availability event carries
+AVAILABILITY_FIELDS = ('id', 'quantity', 'on_loan')
+
+# Queued in place of the events dropped for a client that fell behind
+RESYNC = object()
+
+# Queued to end a stream whose response was closed
+CLOSED = object()
+
+
+def live_setting(name):
+    return getattr(settings, 'LIVE_UPDATES', {}).get(name, DEFAULTS[name])
+
+
+class Subscription:
+    """
+    One client's stream: the books it watches and a bounded queue of pending
+    events, owned by the event loop serving the client.
+    """
+
+    def __init__(self, book_ids, queue_size):
+        self.book_ids = frozenset(book_ids)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = 0
+
+    def offer(self, events):
+        # Runs on the subscriber's loop and never waits, so a slow client cannot stall publishers
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Rather than grow without bound, drop the backlog and tell the client to refetch
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                self.dropped += 1
+                self.queue.put_nowait(RESYNC)
+                return
+
+    async def get(self, timeout):
+        # The next event, or asyncio.TimeoutError after `timeout` seconds of silence
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def wake(self):
+        # Runs on the subscriber's loop: whatever is pending, the next get() returns CLOSED
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSED)
+
+
+class EventStream:
+    """
+    Body of a StreamingHttpResponse that owns a subscription. Django closes
+    the response once it is sent, but closing streaming_content does not
+    reach the generator inside it, so close() unsubscribes itself and then
+    ends the generator: aclose() if it is parked at a yield, a CLOSED event
+    if it is waiting for one. close() may run on any thread.
+    """
+
+    def __init__(self, events, broker, subscription):
+        self.events = events
+        self.broker = broker
+        self.subscription = subscription
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        self.broker.unsubscribe(self.subscription)
+        try:
+            self.subscription.loop.call_soon_threadsafe(self._finish)
+        except RuntimeError:
+            # The loop is gone, and the generator with it
+            pass
+
+    def _finish(self):
+        if self.events.ag_running:
+            self.subscription.wake()
+        else:
+            asyncio.ensure_future(self.events.aclose())
+
+
+class LocalBroker:
+    """
+    In-process fan-out from book ids to the subscriptions watching them.
+    Publishers may run on any thread. A backend shared between processes
+    provides the same subscribe / unsubscribe / watched / publish methods
+    and hands the events it receives to a LocalBroker of its own.
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or live_setting('QUEUE_SIZE')
+        self._lock = threading.Lock()
+        self._watchers = defaultdict(set)
+
+    def subscribe(self, book_ids):
+        subscription = Subscription(book_ids, self.queue_size)
+        with self._lock:
+            for book_id in subscription.book_ids:
+                self._watchers[book_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for book_id in subscription.book_ids:
+                watchers = self._watchers.get(book_id)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self._watchers[book_id]
+
+    def watched(self, book_ids):
+        # The subset of book_ids someone is subscribed to, so idle publishes cost no query
+        with self._lock:
+            return {book_id for book_id in book_ids if book_id in self._watchers}
+
+    def publish(self, events):
+        # events are dicts with an 'id' key; each subscriber gets those for its books
+        targets = defaultdict(list)
+        with self._lock:
+            for event in events:
+                for subscription in self._watchers.get(event['id'], ()):
+                    targets[subscription].append(event)
+        for subscription, batch in targets.items():
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, batch)
+            except RuntimeError:
+                # The client's loop is gone
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(live_setting('BACKEND'))()
+
+
+def availability(book_ids):
+    # Current availability of the given books; removed books come back as deleted
+    rows = {row['id']: row for row in Book.objects.filter(pk__in=book_ids).values(*AVAILABILITY_FIELDS)}
+    return [rows.get(book_id, {'id': book_id, 'deleted': True}) for book_id in sorted(book_ids)]
+
+
+def publish_availability(book_ids):
+    """Push the availability of the changed books to whoever watches them."""
+    broker = get_broker()
+    watched = broker.watched(book_ids)
+    if watched:
+        broker.publish(availability(watched))
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,153 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Default settings, overridable through settings.METRICS
+DEFAULTS = {
+    'ENABLED': True,
+    # Share of requests instrumented; the histograms only hold sampled requests
+    'SAMPLE_RATE': 1.0,
+}
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (help, buckets, RequestSample attribute)
+HISTOGRAMS = {
+    'library_request_duration_seconds': ('Wall time of the request.', SECONDS, 'duration'),
+    'library_db_queries': ('Database queries per request.', (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89), 'db_queries'),
+    'library_db_duration_seconds': ('Time spent in database queries per request.', SECONDS, 'db_time'),
+    'library_http_requests': ('Outbound HTTP requests (Google Books) per request.', (0, 1, 2, 5, 10, 20, 50), 'http_calls'),
+    'library_http_duration_seconds': ('Time spent in outbound HTTP requests per request.', SECONDS, 'http_time'),
+    'library_response_bytes': (
+        'Response body size; streamed responses are not counted.',
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+        'response_bytes',
+    ),
+}
+
+
+def metrics_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+class RequestSample:
+    """Costs of one request, filled in by MetricsMiddleware and track_http()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.http_calls = 0
+        self.http_time = 0.0
+        self.response_bytes = None
+
+    def time_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(time.perf_counter() - started)
+
+    def add_query(self, elapsed):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time += elapsed
+
+    def add_http(self, elapsed):
+        # Lookups may run on pool threads, hence the lock
+        with self._lock:
+            self.http_calls += 1
+            self.http_time += elapsed
+
+
+# The sample of the request being served, if it was picked
+current_sample = ContextVar('current_sample', default=None)
+
+
+@contextmanager
+def track_http():
+    """Count the enclosed outbound HTTP call against the current request."""
+    sample = current_sample.get()
+    if sample is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.add_http(time.perf_counter() - started)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """
+    Histograms per metric and (view, method), rendered in the Prometheus
+    text exposition format by render().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view, method, sample):
+        labels = (('method', method), ('view', view))
+        with self._lock:
+            for name, (_, buckets, attribute) in HISTOGRAMS.items():
+                value = getattr(sample, attribute)
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram(buckets)
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        lines = [
+            '# HELP library_metrics_sample_rate Share of requests the histograms are sampled from.',
+            '# TYPE library_metrics_sample_rate gauge',
+            f'library_metrics_sample_rate {metrics_setting("SAMPLE_RATE")}',
+        ]
+        with self._lock:
+            for name, (help_text, buckets, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label_text = ','.join(f'{key}="{label_value(value)}"' for key, value in labels)
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
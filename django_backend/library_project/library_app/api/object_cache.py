@@ -0,0 +1,157 @@
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from library_app.models import Book, Borrow, CustomUser, Favorite
+from .serializers import BOOK_COLUMNS, USER_COLUMNS
+from .versions import borrows_key, favorites_key
+
+# Default settings, overridable through settings.OBJECT_CACHE
+DEFAULTS = {
+    'ALIAS': 'default',
+    'BOOK_TTL': 300,
+    'LIST_TTL': 120,
+    # Users authenticated by CachedJWTAuthentication
+    'USER_TTL': 60,
+    # Longer per-user lists are paged from the database instead
+    'MAX_LIST_LENGTH': 1000,
+}
+
+# Cached in place of a per-user list too long to keep
+TOO_LONG = 'too-long'
+
+
+def object_cache_setting(name):
+    return getattr(settings, 'OBJECT_CACHE', {}).get(name, DEFAULTS[name])
+
+
+# 'book:<id>' holds a Book .values() row; the per-user lists are cached under their version keys
+def book_key(book_id):
+    return f'book:{book_id}'
+
+
+# Cached users are USER_COLUMNS rows, never the password hash, so their key
+# carries a version of the columns: a deploy that changes them never reads an older shape
+USER_VERSION = zlib.crc32(','.join(USER_COLUMNS).encode())
+
+
+def user_key(user_id):
+    return f'user:{USER_VERSION}:{user_id}'
+
+
+class ObjectCache:
+    """
+    Read-through cache of Book rows (BOOK_COLUMNS dicts) by id, of each user's borrowed and
+    favorite rows and of the users themselves, on the Django cache named by
+    OBJECT_CACHE['ALIAS']. Entries are dropped by changes.record(), which
+    every write path calls, and users by the CustomUser save signals; the
+    TTLs only bound how long a missed invalidation can last.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            'book_hits': 0, 'book_misses': 0, 'list_hits': 0, 'list_misses': 0,
+            'user_hits': 0, 'user_misses': 0, 'invalidations': 0,
+        }
+
+    @property
+    def cache(self):
+        return caches[object_cache_setting('ALIAS')]
+
+    def get_books(self, book_ids):
+        # {id: row} for the ids that exist; misses are loaded in one query and cached
+        keys = {book_key(book_id): book_id for book_id in book_ids}
+        found = {keys[key]: book for key, book in self.cache.get_many(list(keys)).items()}
+        missing = [book_id for book_id in keys.values() if book_id not in found]
+        self._count('book_hits', len(found))
+        self._count('book_misses', len(missing))
+        if missing:
+            loaded = {row['id']: row for row in Book.objects.filter(pk__in=missing).values(*BOOK_COLUMNS)}
+            self.cache.set_many(
+                {book_key(book_id): book for book_id, book in loaded.items()},
+                object_cache_setting('BOOK_TTL'),
+            )
+            found.update(loaded)
+        return found
+
+    def get_borrows(self, user_id):
+        # The user's loans as {'id', 'book_id', 'borrowed_date'} rows, newest first
+        return self._get_list(
+            borrows_key(user_id),
+            Borrow.objects.filter(user_id=user_id).order_by('-borrowed_date', '-id').values('id', 'book_id', 'borrowed_date'),
+        )
+
+    def get_favorites(self, user_id):
+        # The user's favorites as {'id', 'book_id'} rows, newest first
+        return self._get_list(
+            favorites_key(user_id),
+            Favorite.objects.filter(user_id=user_id).order_by('-id').values('id', 'book_id'),
+        )
+
+    def get_user(self, user_id):
+        # The CustomUser with this id, or None when there is none. Its password is
+        # deferred and loaded on first access; token_version is the hash of it that
+        # simplejwt's revoke claim carries
+        key = user_key(user_id)
+        row = self.cache.get(key)
+        if row is not None:
+            self._count('user_hits')
+        else:
+            self._count('user_misses')
+            try:
+                row = CustomUser.objects.filter(pk=user_id).values(*USER_COLUMNS, 'password').first()
+            except (TypeError, ValueError):
+                return None
+            if row is None:
+                return None
+            row['token_version'] = get_md5_hash_password(row.pop('password'))
+            self.cache.set(key, row, object_cache_setting('USER_TTL'))
+        user = CustomUser.from_db(
+            CustomUser.objects.db, list(USER_COLUMNS), [row[column] for column in USER_COLUMNS],
+        )
+        user.token_version = row['token_version']
+        return user
+
+    def invalidate(self, *keys):
+        if keys:
+            self.cache.delete_many(list(keys))
+            self._count('invalidations', len(keys))
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _get_list(self, key, queryset):
+        # A cached list, or None when it is too long to cache and the caller should query
+        rows = self.cache.get(key)
+        if rows is not None:
+            self._count('list_hits')
+            return None if rows == TOO_LONG else rows
+        self._count('list_misses')
+        limit = object_cache_setting('MAX_LIST_LENGTH')
+        rows = list(queryset[:limit + 1])
+        if len(rows) > limit:
+            self.cache.set(key, TOO_LONG, object_cache_setting('LIST_TTL'))
+            return None
+        self.cache.set(key, rows, object_cache_setting('LIST_TTL'))
+        return rows
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+object_cache = ObjectCache()
+
+
+def cached_books(rows, key='id'):
+    # The Book rows behind a page of rows holding book ids under `key`, in page
+    # order; books deleted since the page was cached are left out
+    books = object_cache.get_books({row[key] for row in rows})
+    return [books[row[key]] for row in rows if row[key] in books]
@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination. The cursor holds the sort key of the last
+    row sent, so every page is one indexed range query whatever its depth, and
+    one extra row is fetched to tell whether more follow (no COUNT).
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=('-id',), tiebreaker='id'):
+        self.ordering = self.get_ordering(ordering, tiebreaker)
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after_position(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def paginate_list(self, rows, request, model, ordering=('-id',), tiebreaker='id'):
+        """
+        The same pages over rows already in memory, e.g. a cached per-user
+        list: `rows` are dicts sorted by `ordering`, and the first row after
+        the cursor is found by binary search.
+        """
+        self.ordering = self.get_ordering(ordering, tiebreaker)
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, model)
+        start = 0
+        if position is not None:
+            end = len(rows)
+            while start < end:
+                middle = (start + end) // 2
+                if self.follows(rows[middle], position):
+                    end = middle
+                else:
+                    start = middle + 1
+
+        self.has_more = len(rows) > start + self.page_size
+        self.page = rows[start:start + self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'next_cursor': self.encode_cursor(self.page[-1]) if self.has_more else None,
+            'has_more': self.has_more,
+        })
+
+    def get_ordering(self, ordering, tiebreaker='id'):
+        # A unique column (the primary key by default) breaks ties so every position is unique
+        ordering = tuple(ordering)
+        if ordering[-1].lstrip('-') != tiebreaker:
+            ordering += (('-' if ordering[-1].startswith('-') else '') + tiebreaker,)
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def after_position(self, position):
+        # (a, b, id) > (x, y, z)  <=>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= Q(**equal, **{name + lookup: value})
+            equal[name] = value
+        # Repeat the leading column as a plain range so the index can seek to it
+        first = self.ordering[0]
+        lookup = '__lte' if first.startswith('-') else '__gte'
+        return Q(**{first.lstrip('-') + lookup: position[0]}) & condition
+
+    def follows(self, row, position):
+        # after_position() evaluated in Python on a .values() dict
+        for field, value in zip(self.ordering, position):
+            current = row[field.lstrip('-')]
+            if current != value:
+                return current < value if field.startswith('-') else current > value
+        return False
+
+    def encode_cursor(self, instance):
+        # Pages may hold model instances or .values() dicts
+        get = instance.get if isinstance(instance, dict) else partial(getattr, instance)
+        position = [self._serialize(get(field.lstrip('-'))) for field in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return [self._deserialize(model, field.lstrip('-'), value) for field, value in zip(self.ordering, position)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _deserialize(self, model, name, value):
+        # Annotations such as a relevance score are not model fields and stay as sent
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value
+
+    def _serialize(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
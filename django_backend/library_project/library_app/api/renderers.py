@@ -0,0 +1,34 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional; the json module is used without it
+    orjson = None
+
+
+def dumps(data):
+    # Compact UTF-8 JSON of plain JSON types; TypeError for anything else
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes plain JSON types (the lean list rows, the
+    pagination envelope, messages) in one call, with orjson when installed.
+    Data needing DRF's encoder (datetimes, lazy strings, ...) and indented
+    output go through JSONRenderer as before, so the bytes read the same.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = dumps(data)
+        except (TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape the separators that are invalid in JavaScript
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
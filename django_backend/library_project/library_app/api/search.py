@@ -0,0 +1,82 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from library_app.models import BookSearchTerm
+
+WORD_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+# How much a term found in each column counts towards the relevance score
+FIELD_WEIGHTS = (('isbn', 5), ('title', 3), ('author', 2))
+# Whole-word matches rank above the same word matched as a prefix
+EXACT_MATCH_BONUS = 2
+
+
+def fold(text):
+    # Case and accent folding: "Éthiopie" and "ethiopie" index to the same term
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in WORD_RE.findall(fold(text or ''))]
+
+
+def book_terms(book):
+    terms = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(book, field)):
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def index_books(books):
+    # Rebuild the inverted index rows of the given books in one batch
+    books = [book for book in books if book.pk is not None]
+    if not books:
+        return
+    rows = [
+        BookSearchTerm(term=term, book=book, weight=weight)
+        for book in books
+        for term, weight in book_terms(book).items()
+    ]
+    with transaction.atomic():
+        BookSearchTerm.objects.filter(book__in=books).delete()
+        BookSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def search_books(query):
+    """
+    Rank books matching every word of the query, the last word as a prefix
+    so results follow the user's typing. Aggregates over the index table
+    only and returns {'book': id, 'score': relevance} rows; callers choose
+    the ordering and load the Book rows for the page they keep.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return BookSearchTerm.objects.none().values('book')
+
+    prefix = tokens[-1]
+    exact = [token for token in dict.fromkeys(tokens[:-1]) if token != prefix]
+    # LIKE 'prefix%', on the pattern index whatever the collation
+    prefix_match = Q(term__startswith=prefix)
+
+    # Which query word each matched index row satisfies
+    query_word = Case(
+        *[When(term=token, then=Value(position)) for position, token in enumerate(exact)],
+        When(prefix_match, then=Value(len(exact))),
+        output_field=IntegerField(),
+    )
+    score = Case(
+        When(term__in=exact + [prefix], then=F('weight') * EXACT_MATCH_BONUS),
+        default=F('weight'),
+        output_field=IntegerField(),
+    )
+    return (
+        BookSearchTerm.objects.filter(Q(term__in=exact) | prefix_match)
+        .values('book')
+        .annotate(matched_words=Count(query_word, distinct=True), score=Sum(score))
+        .filter(matched_words=len(exact) + 1)
+    )
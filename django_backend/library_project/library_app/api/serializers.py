@@ -1,21 +1,63 @@
+from django.utils import timezone
 from rest_framework import serializers
 from library_app.models import CustomUser
 from library_app.models import Book, Borrow,Favorite
+from .images import rendition_urls, rendition_urls_for, url_builder
 
 class UserSerializer(serializers.ModelSerializer):
+    profile_images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        exclude = ('profile_image_renditions',)
+        # Taken on registration, never echoed back
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def get_profile_images(self, obj):
+        return rendition_urls(obj.profile_image, obj.profile_image_renditions)
+
+
+# The CustomUser columns UserListSerializer reads; the password hash is never loaded
+USER_COLUMNS = (
+    'id', 'last_login', 'is_superuser', 'user_name', 'first_name', 'last_name', 'email',
+    'date_joined', 'is_active', 'is_staff', 'profile_image', 'profile_image_renditions',
+)
+
+
+class UserListSerializer(UserSerializer):
+    # Read-only listing: groups and user_permissions must be prefetched
     class Meta:
         model = CustomUser
-        fields = "__all__"
-        
+        exclude = ('profile_image_renditions', 'password')
+
 
 class BookSerializer(serializers.ModelSerializer):
-    title = serializers.CharField(source='book_info.title')
-    author = serializers.ListField(source='book_info.author')
-    cover_image = serializers.URLField(source='book_info.cover_image')
-    
+    cover_images = serializers.SerializerMethodField()
+
     class Meta:
         model = Book
-        fields = ['isbn', 'title', 'author', 'cover_image']
+        fields = [
+            'id', 'isbn', 'title', 'author', 'quantity', 'cover_image', 'cover_images', 'inserted_date',
+            'publisher', 'published_date', 'description', 'thumbnail_url',
+            'on_loan', 'total_borrows', 'favorite_count',
+        ]
+
+    def get_cover_images(self, obj):
+        return rendition_urls(obj.cover_image, obj.cover_renditions)
+
+
+def embedded_book(book):
+    # The book embedded in loan and favorite rows
+    return {
+        'id' : book.id,
+        'title': book.title,
+        'author': book.author,
+        'quantity': book.quantity,
+        'cover_image': book.cover_image.url if book.cover_image else None,
+        'cover_images': rendition_urls(book.cover_image, book.cover_renditions),
+        'isbn': book.isbn, 
+        'inserted_date': book.inserted_date,
+    }
 
 
 class BorrowedBookSerializer(serializers.ModelSerializer):
@@ -26,16 +68,7 @@ class BorrowedBookSerializer(serializers.ModelSerializer):
         fields = ('book',)
 
     def get_book(self, obj):
-        book = obj.book
-        return {
-            'id' : book.id,
-            'title': book.title,
-            'author': book.author,
-            'quantity': book.quantity,
-            'cover_image': book.cover_image.url,
-            'isbn': book.isbn, 
-            'inserted_date': book.inserted_date,
-        }
+        return embedded_book(obj.book)
 
 
 class FavoritedBookSerializer(serializers.ModelSerializer):
@@ -46,13 +79,68 @@ class FavoritedBookSerializer(serializers.ModelSerializer):
         fields = ('book',)
 
     def get_book(self, obj):
-        book = obj.book
+        return embedded_book(obj.book)
+
+
+# Book columns read with .values() for the list endpoints; see BookRows
+BOOK_COLUMNS = (
+    'id', 'isbn', 'title', 'author', 'quantity', 'cover_image', 'cover_renditions', 'inserted_date',
+    'publisher', 'published_date', 'description', 'thumbnail_url',
+    'on_loan', 'total_borrows', 'favorite_count',
+)
+
+
+class BookRows:
+    """
+    Lean serialization of Book .values() rows for list responses. full()
+    gives what BookSerializer gives and embedded() what the borrowed and
+    favorited serializers embed, without per-object field machinery; the
+    media URL prefix and time zone are worked out once per response.
+    """
+
+    def __init__(self):
+        self.url = url_builder(Book._meta.get_field('cover_image').storage)
+        self.timezone = timezone.get_current_timezone()
+
+    def datetime(self, value):
+        # DRF's ISO 8601 format, UTC as 'Z'
+        value = value.astimezone(self.timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def full(self, row):
+        cover = row['cover_image']
         return {
-            'id' : book.id,
-            'title': book.title,
-            'author': book.author,
-            'quantity': book.quantity,
-            'cover_image': book.cover_image.url,
-            'isbn': book.isbn, 
-            'inserted_date': book.inserted_date,
-        }
\ No newline at end of file
+            'id': row['id'],
+            'isbn': row['isbn'],
+            'title': row['title'],
+            'author': row['author'],
+            'quantity': row['quantity'],
+            'cover_image': self.url(cover) if cover else None,
+            'cover_images': rendition_urls_for(cover, row['cover_renditions'], self.url),
+            'inserted_date': self.datetime(row['inserted_date']),
+            'publisher': row['publisher'],
+            'published_date': row['published_date'],
+            'description': row['description'],
+            'thumbnail_url': row['thumbnail_url'],
+            'on_loan': row['on_loan'],
+            'total_borrows': row['total_borrows'],
+            'favorite_count': row['favorite_count'],
+        }
+
+    def embedded(self, row):
+        cover = row['cover_image']
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'author': row['author'],
+            'quantity': row['quantity'],
+            'cover_image': self.url(cover) if cover else None,
+            'cover_images': rendition_urls_for(cover, row['cover_renditions'], self.url),
+            'isbn': row['isbn'],
+            'inserted_date': self.datetime(row['inserted_date']),
+        }
+
+class BorrowSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Borrow
+        fields = ('id', 'book', 'borrowed_date', 'return_date', 'quantity_borrowed')
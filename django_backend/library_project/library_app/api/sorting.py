@@ -0,0 +1,29 @@
+from operator import attrgetter
+
+# Columns clients may sort book lists by; each has a (column, id) index
+SORT_FIELDS = ('title', 'author', 'isbn', 'inserted_date')
+
+
+def get_sort_ordering(request, default):
+    """
+    Read ?sort=<field>&order=asc|desc into an ordering the database (and the
+    keyset cursor) can serve from an index. Returns `default` when no sort
+    is asked for and raises ValueError for unknown values.
+    """
+    field = request.query_params.get('sort')
+    order = request.query_params.get('order', 'asc')
+    if not field:
+        return default
+    if field not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    sign = '-' if order == 'desc' else ''
+    return (sign + field, sign + 'id')
+
+
+def sort_books(books, field, descending=False):
+    # Stable O(n log n) sort for result sets already in memory
+    if field not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    return sorted(books, key=attrgetter(field), reverse=descending)
@@ -0,0 +1,253 @@
+import datetime
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from library_app.models import ActivityRollup, Book, BookActivity, Borrow, Favorite, LibraryActivity, UserActivity
+
+# Default settings, overridable through settings.STATS
+DEFAULTS = {
+    # Rows each library bucket is split over, so concurrent writers rarely share one
+    'SHARDS': 16,
+}
+
+HOUR = ActivityRollup.HOUR
+DAY = ActivityRollup.DAY
+ALL = ActivityRollup.ALL
+
+# The one bucket of the running totals
+TOTAL_BUCKET = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+STEPS = {HOUR: datetime.timedelta(hours=1), DAY: datetime.timedelta(days=1)}
+
+# Longest series and top-N list /stats/ serves
+MAX_BUCKETS = {HOUR: 24 * 14, DAY: 366}
+MAX_TOP = 50
+
+# Rollup tables and their unique keys, in the order they are written
+TABLES = (
+    (LibraryActivity, ('period', 'bucket', 'shard')),
+    (BookActivity, ('period', 'bucket', 'book_id')),
+    (UserActivity, ('user_id', 'period', 'bucket')),
+)
+
+
+def stats_setting(name):
+    return getattr(settings, 'STATS', {}).get(name, DEFAULTS[name])
+
+
+def bucket_start(at, period):
+    # The UTC hour or day `at` falls in; every moment is in the one total bucket
+    at = at.astimezone(datetime.timezone.utc)
+    if period == HOUR:
+        return at.replace(minute=0, second=0, microsecond=0)
+    if period == DAY:
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return TOTAL_BUCKET
+
+
+def day_bucket(date):
+    return datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc)
+
+
+def counter_fields(model):
+    return [field.attname for field in model._meta.concrete_fields if isinstance(field, models.PositiveIntegerField)]
+
+
+def increment(model, key_fields, rows, batch_size=100):
+    """
+    Add {key: Counter} rows to `model` with one INSERT ... ON CONFLICT (ON
+    DUPLICATE KEY on MySQL) per batch, so concurrent writers add up instead
+    of overwriting each other. Counters the table lacks are ignored.
+    """
+    counters = counter_fields(model)
+    rows = sorted(
+        (key, [amounts.get(counter, 0) for counter in counters])
+        for key, amounts in rows.items()
+        if any(amounts.get(counter) for counter in counters)
+    )
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = list(key_fields) + counters
+    fields = [model._meta.get_field(column) for column in columns]
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+            f'{quote(counter)} = {quote(counter)} + VALUES({quote(counter)})' for counter in counters
+        )
+    else:
+        conflict = f'ON CONFLICT ({", ".join(quote(key) for key in key_fields)}) DO UPDATE SET ' + ', '.join(
+            f'{quote(counter)} = {table}.{quote(counter)} + EXCLUDED.{quote(counter)}' for counter in counters
+        )
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(value, connection)
+                for key, amounts in batch
+                for field, value in zip(fields, (*key, *amounts))
+            ]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(quote(column) for column in columns)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} {conflict}',
+                params,
+            )
+
+
+def activity(book_id=None, user_id=None, **counters):
+    # One event for count_activity(), e.g. activity(book.id, user.id, borrows=1)
+    return book_id, user_id, counters
+
+
+def count_activity(*events, at=None):
+    """
+    Add each event's counters to the library, book and user rollups of the
+    hour and day of `at` (now by default) and to the running totals, in one
+    upsert per table. Called inside the write's transaction, so the rollups
+    commit or roll back with it; the library rows go to a random shard, so
+    concurrent writes only wait on each other when they touch the same
+    book or user.
+    """
+    at = at or timezone.now()
+    buckets = [(period, bucket_start(at, period)) for period in (HOUR, DAY, ALL)]
+    shard = random.randrange(stats_setting('SHARDS'))
+    rows = [defaultdict(Counter) for _ in TABLES]
+    for book_id, user_id, counters in events:
+        for period, bucket in buckets:
+            rows[0][(period, bucket, shard)].update(counters)
+            if book_id is not None:
+                rows[1][(period, bucket, book_id)].update(counters)
+            if user_id is not None:
+                rows[2][(user_id, period, bucket)].update(counters)
+    for (model, key_fields), table_rows in zip(TABLES, rows):
+        increment(model, key_fields, table_rows)
+
+
+def _add_all(model, key_fields, rows, batch_size):
+    # increment() over a stream of (key, {counter: n}) with unique keys, batch by batch
+    batch = {}
+    for key, amounts in rows:
+        batch[key] = amounts
+        if len(batch) >= batch_size:
+            increment(model, key_fields, batch)
+            batch = {}
+    increment(model, key_fields, batch)
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute the rollups from the Borrow, Favorite and Book tables, in one
+    transaction. Only what the source tables can date is replaced: loans
+    carry a date only, so their hourly counts are kept from the live
+    counting, and favorites carry no date at all, so their hourly and daily
+    counts are kept and the running totals count the favorites that exist.
+    """
+    library_key = dict(TABLES)[LibraryActivity]
+    with transaction.atomic():
+        for model, _ in TABLES:
+            model.objects.filter(period=ALL).delete()
+            model.objects.filter(period=DAY).update(borrows=0, returns=0)
+        LibraryActivity.objects.filter(period__in=(HOUR, DAY)).update(new_books=0)
+
+        for date_field, counter in (('borrowed_date', 'borrows'), ('return_date', 'returns')):
+            loans = Borrow.objects.filter(**{f'{date_field}__isnull': False}).order_by()
+            for model, owner in ((BookActivity, 'book_id'), (UserActivity, 'user_id')):
+                key_fields = dict(TABLES)[model]
+                per_day = loans.values(owner, date_field).annotate(count=Count('id')).iterator()
+                _add_all(model, key_fields, (
+                    (_key(key_fields, DAY, day_bucket(row[date_field]), row[owner]), {counter: row['count']})
+                    for row in per_day
+                ), batch_size)
+                in_total = loans.values(owner).annotate(count=Count('id')).iterator()
+                _add_all(model, key_fields, (
+                    (_key(key_fields, ALL, TOTAL_BUCKET, row[owner]), {counter: row['count']}) for row in in_total
+                ), batch_size)
+            _add_all(LibraryActivity, library_key, (
+                ((DAY, day_bucket(row[date_field]), 0), {counter: row['count']})
+                for row in loans.values(date_field).annotate(count=Count('id')).iterator()
+            ), batch_size)
+            increment(LibraryActivity, library_key, {(ALL, TOTAL_BUCKET, 0): {counter: loans.count()}})
+
+        _add_all(BookActivity, dict(TABLES)[BookActivity], (
+            ((ALL, TOTAL_BUCKET, row['book_id']), {'favorites_added': row['count']})
+            for row in Favorite.objects.values('book_id').annotate(count=Count('id')).order_by().iterator()
+        ), batch_size)
+        increment(LibraryActivity, library_key, {(ALL, TOTAL_BUCKET, 0): {'favorites_added': Favorite.objects.count()}})
+
+        utc = datetime.timezone.utc
+        for period, trunc in ((HOUR, TruncHour), (DAY, TruncDay)):
+            new_books = (
+                Book.objects.annotate(bucket=trunc('inserted_date', tzinfo=utc))
+                .values('bucket').annotate(count=Count('id')).order_by()
+            )
+            _add_all(LibraryActivity, library_key, (
+                ((period, row['bucket'], 0), {'new_books': row['count']}) for row in new_books.iterator()
+            ), batch_size)
+        increment(LibraryActivity, library_key, {(ALL, TOTAL_BUCKET, 0): {'new_books': Book.objects.count()}})
+
+        # Rows the reset emptied and nothing added back to
+        for model, _ in TABLES:
+            model.objects.filter(**dict.fromkeys(counter_fields(model), 0)).delete()
+
+
+def _key(key_fields, period, bucket, owner):
+    # A rollup key in `key_fields` order
+    values = {'period': period, 'bucket': bucket}
+    return tuple(values.get(field, owner) for field in key_fields)
+
+
+def summary(period, buckets, top, user_id=None):
+    """
+    Totals, a series of the last `buckets` hours or days and the `top` most
+    borrowed books of that window, read from the rollups alone: the cost
+    follows the window and the books active in it, not the history.
+    Returns (totals, series, popular, user) with popular as (book_id, borrows).
+    """
+    step = STEPS[period]
+    end = bucket_start(timezone.now(), period)
+    start = end - step * (buckets - 1)
+    counters = counter_fields(LibraryActivity)
+
+    # Library buckets are summed over their shards
+    sums = {f'sum_{counter}': Sum(counter) for counter in counters}
+
+    totals = LibraryActivity.objects.filter(period=ALL, bucket=TOTAL_BUCKET).aggregate(**sums)
+    totals = {counter: totals[f'sum_{counter}'] or 0 for counter in counters}
+    totals['active_loans'] = totals['borrows'] - totals['returns']
+
+    stored = {
+        row['bucket']: row
+        for row in LibraryActivity.objects.filter(period=period, bucket__gte=start)
+        .values('bucket').annotate(**sums).order_by()
+    }
+    series = []
+    for number in range(buckets):
+        bucket = start + step * number
+        row = stored.get(bucket, {})
+        series.append({'bucket': bucket, **{counter: row.get(f'sum_{counter}', 0) for counter in counters}})
+    # Open loans at the end of each bucket, worked back from the running total
+    active = totals['active_loans']
+    for point in reversed(series):
+        point['active_loans'] = active
+        active -= point['borrows'] - point['returns']
+
+    popular = list(
+        BookActivity.objects.filter(period=period, bucket__gte=start)
+        .values('book_id').annotate(total=Sum('borrows')).filter(total__gt=0)
+        .order_by('-total', 'book_id').values_list('book_id', 'total')[:top]
+    )
+
+    user = None
+    if user_id is not None:
+        user = UserActivity.objects.filter(user_id=user_id, period=period, bucket__gte=start).aggregate(
+            borrows=Sum('borrows'), returns=Sum('returns'),
+        )
+        user = {key: value or 0 for key, value in user.items()}
+    return totals, series, popular, user
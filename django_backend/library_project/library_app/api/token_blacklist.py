@@ -0,0 +1,211 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Default settings, overridable through settings.TOKEN_BLACKLIST
+DEFAULTS = {
+    # The prefilter is only sound when ALIAS is shared by every worker (Redis)
+    'PREFILTER': False,
+    'ALIAS': 'default',
+    'CAPACITY': 1000000,
+    'ERROR_RATE': 0.001,
+    # Seconds a missing blacklist id is re-read for before it counts as rolled back
+    'GAP_TIMEOUT': 600,
+}
+
+# Bumped after every committed blacklisting, so other workers know to sync
+VERSION_KEY = 'token-blacklist:version'
+
+# Ids below the highest one a full rebuild read that may still be uncommitted
+REBUILD_GAP_WINDOW = 1000
+
+
+def token_blacklist_setting(name):
+    return getattr(settings, 'TOKEN_BLACKLIST', {}).get(name, DEFAULTS[name])
+
+
+class BloomFilter:
+    """Set membership with false positives at about `error_rate`, and no false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + number * second) % self.size for number in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    Bloom filter of the blacklisted refresh-token jtis, kept in each worker.
+    A jti it does not contain is certainly not blacklisted, so the common
+    refresh skips the blacklist query. Workers stay in step through one
+    counter in the shared cache: when it moved, the rows blacklisted since
+    the last sync are read by id. Ids are committed out of order, so the
+    ids skipped so far are read again on every sync until they show up or
+    GAP_TIMEOUT passes (a rolled-back insert). Filtered jtis still get the
+    query, and losing the counter only costs a sync.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._bloom_capacity = 0
+        self._last_id = 0
+        # {id: monotonic time it was first skipped}
+        self._gaps = {}
+        self._version = None
+        self.stats = {'skipped': 0, 'checked': 0, 'syncs': 0}
+
+    @property
+    def cache(self):
+        return caches[token_blacklist_setting('ALIAS')]
+
+    def might_contain(self, jti):
+        self._sync()
+        with self._lock:
+            found = jti in self._bloom
+            self.stats['checked' if found else 'skipped'] += 1
+        return found
+
+    def add(self, jti):
+        # Seen by this worker at once; the others sync after publish()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def publish(self):
+        # Called once the blacklisting is committed
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, random.getrandbits(62), None)
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._last_id = 0
+            self._gaps = {}
+            self._version = None
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _sync(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # A random start, so a counter lost and recreated never matches an old one
+            self.cache.add(VERSION_KEY, random.getrandbits(62), None)
+            version = self.cache.get(VERSION_KEY)
+        with self._lock:
+            if version is not None and version == self._version and self._bloom is not None:
+                return
+            self.stats['syncs'] += 1
+            capacity = token_blacklist_setting('CAPACITY')
+            if self._bloom is None or self._bloom.count > self._bloom_capacity:
+                # First use, or grown past its size: rebuild from the tokens still live
+                self._bloom_capacity = max(capacity, 2 * (self._bloom.count if self._bloom else 0))
+                self._bloom = BloomFilter(self._bloom_capacity, token_blacklist_setting('ERROR_RATE'))
+                self._rebuild()
+            else:
+                self._load_new()
+            self._version = version
+
+    def _rebuild(self):
+        # Everything still live; the ids missing just below the top may be uncommitted
+        self._last_id = 0
+        self._gaps = {}
+        recent = deque(maxlen=REBUILD_GAP_WINDOW)
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        for row_id, jti in rows.order_by('id').values_list('id', 'token__jti').iterator(chunk_size=10000):
+            self._bloom.add(jti)
+            recent.append(row_id)
+            self._last_id = row_id
+        now = time.monotonic()
+        for row_id in set(range(self._last_id - REBUILD_GAP_WINDOW + 1, self._last_id)).difference(recent):
+            if row_id > 0:
+                self._gaps[row_id] = now
+
+    def _load_new(self):
+        # Rows above the last id read, and any skipped ids that have committed since
+        now = time.monotonic()
+        timeout = token_blacklist_setting('GAP_TIMEOUT')
+        self._gaps = {row_id: skipped_at for row_id, skipped_at in self._gaps.items() if now - skipped_at < timeout}
+        rows = BlacklistedToken.objects.filter(Q(id__gt=self._last_id) | Q(id__in=list(self._gaps)))
+        for row_id, jti in rows.order_by('id').values_list('id', 'token__jti').iterator(chunk_size=10000):
+            self._bloom.add(jti)
+            if row_id <= self._last_id:
+                self._gaps.pop(row_id, None)
+                continue
+            for skipped in range(self._last_id + 1, row_id):
+                self._gaps[skipped] = now
+            self._last_id = row_id
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check asks the Bloom filter first."""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not token_blacklist_setting('PREFILTER') or blacklist_filter.might_contain(jti):
+            super().check_blacklist()
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class FilteredTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = FilteredRefreshToken
+
+
+def prune_expired_tokens(batch_size=5000, pause=0, now=None):
+    """
+    Delete outstanding tokens past their expiry, with their blacklist rows,
+    oldest first in batches of `batch_size` read off the expires_at index.
+    Yields the number of tokens deleted per batch.
+    """
+    now = now or timezone.now()
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
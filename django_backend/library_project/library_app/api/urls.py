@@ -7,12 +7,23 @@ from .views import (
     APIEndpoints,
     Register,
     UserList,
+    BulkRegisterUsers,
+    UserExport,
     UserProfile,
     BorrowBookView,
+    ReturnBookView,
+    SyncView,
+    availability_stream,
+    ObjectCacheStats,
+    StatsView,
+    MetricsView,
     BookList,
+    AddBookByISBN,
+    BulkAddBooksByISBN,
     SearchBook,
     BorrowedBooksList,
     ToggleFavoriteView,
+    SyncFavoritesView,
     FavoritedBooksList
 )
 
@@ -21,13 +32,24 @@ urlpatterns = [
     path('', APIEndpoints.as_view(), name='home'),
     path('search/', SearchBook.as_view(), name='search-books'),
     path('books/', BookList.as_view(), name='books'),
+    path('books/add/', AddBookByISBN.as_view(), name='add-book'),
+    path('books/import/', BulkAddBooksByISBN.as_view(), name='import-books'),
     path('borrowed-books/', BorrowedBooksList.as_view(), name='borrowed-books'),
     path('borrow/<int:book_id>/', BorrowBookView.as_view(), name='borrow-book'),
+    path('return/<int:book_id>/', ReturnBookView.as_view(), name='return-book'),
     path('favorited-books/', FavoritedBooksList.as_view(), name='favorited -books'),
     path('favorite/<int:book_id>/', ToggleFavoriteView.as_view(), name='favorite'),
+    path('favorites/sync/', SyncFavoritesView.as_view(), name='sync-favorites'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('live/availability/', availability_stream, name='live-availability'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('cache/stats/', ObjectCacheStats.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     
     #User related Endpoints
     path('users/', UserList.as_view(), name='users'),
+    path('users/import/', BulkRegisterUsers.as_view(), name='import-users'),
+    path('users/export/', UserExport.as_view(), name='export-users'),
     path('user/profile/', UserProfile.as_view(), name='user_profile'),
     
     #Authentication Endpoints
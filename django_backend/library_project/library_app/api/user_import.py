@@ -0,0 +1,136 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from library_app.models import CustomUser
+
+FIELDS = ('user_name', 'email', 'first_name', 'last_name', 'password')
+
+
+def read_user_rows(lines):
+    """
+    Read users from a CSV stream with a header row naming the FIELDS columns
+    (in any order). Yields one dict per row.
+    """
+    decoded = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    for row in csv.DictReader(decoded):
+        yield {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+
+def validate_row(row):
+    # {field: message} for a row that cannot be created as it stands
+    errors = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if not isinstance(value, str) or not value:
+            errors[field] = 'This field is required.'
+            continue
+        max_length = CustomUser._meta.get_field(field).max_length
+        if field != 'password' and len(value) > max_length:
+            errors[field] = f'Ensure this field has no more than {max_length} characters.'
+    if 'email' not in errors:
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            errors['email'] = 'Enter a valid email address.'
+    return errors
+
+
+def import_users(rows, batch_size=500, workers=None):
+    """
+    Create users from a stream of row dicts, batch by batch, and yield one
+    result dict per row. user_name uniqueness is checked once per batch
+    against the table and across the whole stream in memory; passwords are
+    hashed across a pool of `workers` processes (one per core by default),
+    and each batch is inserted with one bulk_create.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Children set Django up themselves, so the pool works with spawn as well as fork
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+    seen = set()
+    rows = iter(rows)
+    number = 0
+    with pool or nullcontext():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield from _import_batch(batch, number, seen, pool, workers)
+            number += len(batch)
+
+
+def _import_batch(batch, first_number, seen, pool, workers):
+    results = []
+    pending = []
+    for number, row in enumerate(batch, start=first_number + 1):
+        if not isinstance(row, dict):
+            results.append({'row': number, 'status': 'invalid', 'errors': {'row': 'Expected an object.'}})
+            continue
+        user_name = row.get('user_name')
+        errors = validate_row(row)
+        if errors:
+            results.append({'row': number, 'user_name': user_name, 'status': 'invalid', 'errors': errors})
+        elif user_name in seen:
+            results.append({'row': number, 'user_name': user_name, 'status': 'duplicate'})
+        else:
+            seen.add(user_name)
+            pending.append((number, row))
+
+    existing = set(
+        CustomUser.objects.filter(user_name__in=[row['user_name'] for _, row in pending]).values_list('user_name', flat=True)
+    )
+    for number, row in pending:
+        if row['user_name'] in existing:
+            results.append({'row': number, 'user_name': row['user_name'], 'status': 'exists'})
+    pending = [(number, row) for number, row in pending if row['user_name'] not in existing]
+
+    # PBKDF2 is the whole cost of an import, so it is spread over the pool
+    passwords = [row['password'] for _, row in pending]
+    if pool is not None:
+        hashes = list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    else:
+        hashes = [make_password(password) for password in passwords]
+
+    users = [
+        CustomUser(
+            user_name=row['user_name'],
+            email=CustomUser.objects.normalize_email(row['email']),
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            password=password,
+        )
+        for (_, row), password in zip(pending, hashes)
+    ]
+    created, taken = _insert(users)
+    numbers = {row['user_name']: number for number, row in pending}
+    for user in taken:
+        results.append({'row': numbers[user.user_name], 'user_name': user.user_name, 'status': 'exists'})
+    for user in created:
+        results.append({'row': numbers[user.user_name], 'user_name': user.user_name, 'status': 'created', 'id': user.id})
+    results.sort(key=lambda result: result['row'])
+    return results
+
+
+def _insert(users):
+    # (created, taken): a user_name registered since the check leaves the rest of the batch in
+    if not users:
+        return [], []
+    try:
+        with transaction.atomic():
+            return CustomUser.objects.bulk_create(users), []
+    except IntegrityError:
+        taken = set(
+            CustomUser.objects.filter(user_name__in=[user.user_name for user in users]).values_list('user_name', flat=True)
+        )
+        if not taken:
+            raise
+        created, also_taken = _insert([user for user in users if user.user_name not in taken])
+        return created, [user for user in users if user.user_name in taken] + also_taken
@@ -0,0 +1,88 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from library_app.models import DataVersion
+
+# Version keys: 'books' covers the catalog fields of every book, 'book:<id>'
+# everything shown of one book (its stock and counters too), and
+# 'borrows:<user id>' and 'favorites:<user id>' cover one user's lists.
+CATALOG = 'books'
+
+
+def book_version_key(book_id):
+    return f'book:{book_id}'
+
+
+def borrows_key(user_id):
+    return f'borrows:{user_id}'
+
+
+def favorites_key(user_id):
+    return f'favorites:{user_id}'
+
+
+def bump(*keys):
+    # Give every key a fresh token in one upsert
+    now = timezone.now()
+    DataVersion.objects.bulk_create(
+        [DataVersion(key=key, token=uuid.uuid4().hex, updated_at=now) for key in dict.fromkeys(keys)],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['token', 'updated_at'],
+    )
+
+
+def validators(request, keys):
+    """
+    ETag and Last-Modified for a response built from `keys`, read from the
+    version table alone. The query string is part of the ETag so every
+    page, sort and page size validates separately.
+    """
+    rows = DataVersion.objects.filter(key__in=keys).values_list('key', 'token', 'updated_at')
+    versions = {key: (token, updated_at) for key, token, updated_at in rows}
+    seed = '|'.join([request.get_full_path()] + [f'{key}={versions.get(key, ("",))[0]}' for key in sorted(keys)])
+    etag = quote_etag(hashlib.sha1(seed.encode()).hexdigest())
+    last_modified = max((updated_at for _, updated_at in versions.values()), default=None)
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def conditional_get(version_keys):
+    """
+    Decorate an APIView get() whose response depends on the version keys
+    `version_keys(request)` names plus those of the books on its page. The
+    view pages its book ids, then calls not_modified() and returns its 304
+    if there is one, before any row is loaded or serialized; the decorator
+    sets the ETag and Last-Modified either way.
+    """
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            request.version_keys = list(version_keys(request))
+            request.validators = None
+            response = get(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300 or response.status_code == 304:
+                etag, last_modified = request.validators or validators(request, request.version_keys)
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+                # Clients may keep the body but must revalidate before reusing it
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def not_modified(request, book_ids):
+    """
+    Add the version keys of the books on the page, so a loan of any of them
+    changes the ETag and one of any other book does not, and return a 304
+    response if the client's copy still holds, else None.
+    """
+    request.version_keys.extend(book_version_key(book_id) for book_id in dict.fromkeys(book_ids))
+    request.validators = etag, last_modified = validators(request, request.version_keys)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
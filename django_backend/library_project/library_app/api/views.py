@@ -1,44 +1,46 @@
+import logging
+
 from django.shortcuts import redirect
 from rest_framework.response import Response
 from rest_framework import status
 from library_app.models import CustomUser, Book, Favorite, Borrow
-from .serializers import UserSerializer, BorrowedBookSerializer, FavoritedBookSerializer
-from .serializers import BookSerializer
+from .serializers import USER_COLUMNS, UserListSerializer, UserSerializer
+from .serializers import BookRows, BookSerializer, BorrowSyncSerializer
 from rest_framework.decorators import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.db import transaction
+from django.db import IntegrityError, transaction
 import datetime
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 from .LinkedList import Node,LinkedList
+from .google_books import GoogleBooksError, get_book_info_from_google
+from .bulk_import import ISBN_RE, clean_isbn, import_isbns
+from .user_import import import_users, read_user_rows
+from .user_export import CONTENT_TYPES, export_users
+from .pagination import KeysetPagination
+from .search import search_books
+from .sorting import get_sort_ordering
+from .changes import availability_change, borrow_change, changes_since, favorite_change, latest_states, record
+from .versions import CATALOG, borrows_key, conditional_get, favorites_key, not_modified
+from .object_cache import cached_books, object_cache
+from .stats import DAY, HOUR, MAX_BUCKETS, MAX_TOP, activity, count_activity, summary
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+from .live import CLOSED, RESYNC, EventStream, availability, get_broker, live_setting, sse
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
 
 # 404 handler
 def handler404(request, exception):
     redirect('home')
     
 
-import requests
-
-def get_book_info_from_google(isbn):
-    url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        data = response.json()
-        if 'items' in data:
-            book_info = data['items'][0]['volumeInfo']
-            return {
-                'title': book_info.get('title', ''),
-                'author': book_info.get('authors', []),
-                'publisher': book_info.get('publisher', ''),
-                'publishedDate': book_info.get('publishedDate', ''),
-                'description': book_info.get('description', ''),
-                'cover_image': book_info.get('imageLinks', {}).get('thumbnail', ''),
-            }
-    return None
-
-
 # API view for listing API endpoints
 class APIEndpoints(APIView):
     def get(self, request):
@@ -56,6 +58,14 @@ class APIEndpoints(APIView):
                 'description': 'List all users.',
                 'access_level': 'Superuser',  # Requires superuser access
             },
+            reverse('export-users'): {
+                'description': 'Download all users as CSV (?output=csv) or NDJSON (?output=ndjson).',
+                'access_level': 'Superuser',  # Requires superuser access
+            },
+            reverse('import-users'): {
+                'description': 'Create users in bulk from a CSV file or a JSON list.',
+                'access_level': 'Superuser',  # Requires superuser access
+            },
             reverse('user_profile'): {
                 'description': 'View user profile information.',
                 'access_level': 'Superuser',  # Requires superuser access
@@ -73,24 +83,52 @@ class APIEndpoints(APIView):
 class UserList(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
     def get(self, request):
-        # Retrieve a list of all users
-        users = CustomUser.objects.all()
+        # Only the listed columns, and one query per relation for the whole page
+        users = CustomUser.objects.only(*USER_COLUMNS).prefetch_related('groups', 'user_permissions')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(users, request, ordering=('id',))
         
-        # Serialize the user data
-        serializer = UserSerializer(users, many=True)
+        # Serialize the user data, without the password hash
+        serializer = UserListSerializer(page, many=True)
         
-        # Return the serialized data in the response
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Return one page of serialized data in the response
+        return paginator.get_paginated_response(serializer.data)
+
+# API view for exporting every user as CSV or NDJSON (admins only)
+class UserExport(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        output = request.GET.get('output', 'csv')
+        if output not in CONTENT_TYPES:
+            return Response({'message': 'output must be "csv" or "ndjson".'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export_users(output), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="users.{output}"'
+        return response
+
+# API view for creating many users at once (admins only)
+class BulkRegisterUsers(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def post(self, request):
+        # Accept either an uploaded CSV file or a JSON list of user objects
+        if 'file' in request.FILES:
+            rows = read_user_rows(request.FILES['file'])
+        elif isinstance(request.data.get('users'), list):
+            rows = request.data['users']
+        else:
+            return Response({'message': 'Provide a "file" upload or a "users" list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Stream one JSON line per row; passwords are never echoed back
+        report = (json.dumps(result) + '\n' for result in import_users(rows))
+        return StreamingHttpResponse(report, content_type='application/x-ndjson')
 
 # API view for user profile
 class UserProfile(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        # Retrieve the user's profile based on the authenticated user's ID
-        user = CustomUser.objects.get(id=request.user.id)
-        
-        # Serialize the user's profile data
-        serializer = UserSerializer(user)
+        # The authenticated user is already loaded (and cached) by the authentication
+        serializer = UserSerializer(request.user)
         
         # Return the serialized data in the response
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -102,10 +140,6 @@ class Register(APIView):
         # Deserialize the request data using the UserSerializer
         serializer = UserSerializer(data=request.data)
         
-        # Debugging prints to inspect the request data and serializer validity
-        print(request.data)
-        print(serializer.is_valid())
-        
         if serializer.is_valid():
             # If the serializer data is valid, create a new CustomUser
             user = CustomUser.objects.create_user(
@@ -120,9 +154,8 @@ class Register(APIView):
             # Return a success response
             return Response({'message': 'User created successfully'}, status=status.HTTP_201_CREATED)
         else:
-            # Debugging prints to inspect serializer error messages and errors
-            print(serializer.error_messages)
-            print(serializer._errors)
+            # Log the rejected fields only; the request data holds the password
+            logger.info('Registration rejected: %s', serializer.errors)
             
             # Return a response with serializer errors
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -131,19 +164,24 @@ class Register(APIView):
 class BookList(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(lambda request: [CATALOG])
     def get(self, request):
-        books = Book.objects.all()
-        serializer = BookSerializer(books, many=True)
-        
-        # Ajouter les infos supplémentaires du livre à partir de l'API Google Books
-        for book in books:
-            book_info = get_book_info_from_google(book.isbn)
-            if book_info:
-                # Mettez à jour le livre ou faites en sorte d'envoyer les données récupérées avec le serializer
-                book_info['isbn'] = book.isbn  # Assurez-vous d'inclure l'ISBN pour chaque livre
-                print(book_info)
-        
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Google Books metadata is stored on the rows; the page query reads
+        # only the sort keys off the index and the rows come from the cache
+        try:
+            ordering = get_sort_ordering(request, default=('-inserted_date', '-id'))
+        except ValueError as error:
+            return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = KeysetPagination()
+        ordering = paginator.get_ordering(ordering)
+        books = Book.objects.values(*[field.lstrip('-') for field in ordering])
+        page = paginator.paginate_queryset(books, request, ordering=ordering)
+        unchanged = not_modified(request, [book['id'] for book in page])
+        if unchanged is not None:
+            return unchanged
+        rows = BookRows()
+        return paginator.get_paginated_response([rows.full(book) for book in cached_books(page)])
 
     
 # API view for searching books
@@ -152,152 +190,436 @@ class SearchBook(APIView):
 
     def get(self, request):
         query = request.GET.get('query', '').strip()
-        
-        if query:
-            # Si la recherche est par ISBN
-            if len(query) == 13:  # ISBN standard de 13 caractères
-                book_info = get_book_info_from_google(query)
-                if book_info:
-                    return Response(book_info, status=status.HTTP_200_OK)
-                else:
-                    return Response({'message': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Recherche classique par titre, auteur, etc.
-            books = Book.objects.filter(
-                Q(author__icontains=query) |
-                Q(title__icontains=query) |
-                Q(isbn=query)
-            )
-            serializer = BookSerializer(books, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-    
-    def sort_by_title(self, books):
-        # Custom sorting algorithm for title (bubble sort)
-        n = len(books)
-        for i in range(n - 1):
-            for j in range(0, n - i - 1):
-                if books[j].title > books[j + 1].title:
-                    books[j], books[j + 1] = books[j + 1], books[j]
-        return books
-
-    def sort_by_author(self, books):
-        # Custom sorting algorithm for author (selection sort)
-        n = len(books) 
-        for i in range(n):
-            min_idx = i
-            for j in range(i + 1, n):
-                if books[j].author < books[min_idx].author:
-                    min_idx = j
-            books[i], books[min_idx] = books[min_idx], books[i]
-            
-        return books
-
-    def sort_by_isbn(self, books):
-        # Custom sorting algorithm for isbn (insertion sort)
-        n = len(books)
-        for i in range(1, n):
-            key = books[i]
-            j = i - 1
-            while j >= 0 and key.isbn < books[j].isbn:
-                books[j + 1] = books[j]
-                j -= 1
-            books[j + 1] = key
-        return books
+        if not query:
+            return Response({'message': 'A search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ordering = get_sort_ordering(request, default=None)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Si la recherche est par ISBN
+        if len(query) == 13:  # ISBN standard de 13 caractères
+            try:
+                book_info = get_book_info_from_google(query, raise_errors=True)
+            except GoogleBooksError:
+                return Response({'message': 'Google Books is unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if book_info:
+                return Response(book_info, status=status.HTTP_200_OK)
+            else:
+                return Response({'message': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Recherche classique par titre, auteur, etc. dans l'index
+        matches = search_books(query)
+        paginator = KeysetPagination()
+        if ordering is not None:
+            # Tri explicite : la base trie les livres trouvés sur un index
+            ordering = paginator.get_ordering(ordering)
+            books = Book.objects.filter(id__in=matches.values('book')).values(*[field.lstrip('-') for field in ordering])
+            page = paginator.paginate_queryset(books, request, ordering=ordering)
+            rows = BookRows()
+            return paginator.get_paginated_response([rows.full(book) for book in cached_books(page)])
+
+        # Sinon, par pertinence
+        page = paginator.paginate_queryset(matches, request, ordering=('-score', '-book'), tiebreaker='book')
+        rows = BookRows()
+        return paginator.get_paginated_response([rows.full(book) for book in cached_books(page, key='book')])
 
 class BorrowedBooksList(APIView):
     permission_classes = [IsAuthenticated]
+    @conditional_get(lambda request: [CATALOG, borrows_key(request.user.id)])
     def get(self, request):
-        # get the user's object
-        user = get_object_or_404(CustomUser, id=request.user.id)
+        user = request.user
+
+        # The user's loans and their books come from the object cache;
+        # a loan history too long to cache is paged from the database
+        paginator = KeysetPagination()
+        loans = object_cache.get_borrows(user.id)
+        if loans is not None:
+            page = paginator.paginate_list(loans, request, Borrow, ordering=('-borrowed_date', '-id'))
+        else:
+            borrowed_books = Borrow.objects.filter(user=user).values('id', 'book_id', 'borrowed_date')
+            page = paginator.paginate_queryset(borrowed_books, request, ordering=('-borrowed_date', '-id'))
 
-        # Query for books borrowed by the usera
-        borrowed_books = Borrow.objects.select_related('book').filter(user=user)
+        unchanged = not_modified(request, [loan['book_id'] for loan in page])
+        if unchanged is not None:
+            return unchanged
+        # Same rows as BorrowedBookSerializer, without its per-object machinery
+        rows = BookRows()
+        return paginator.get_paginated_response([{'book': rows.embedded(book)} for book in cached_books(page, key='book_id')])
 
-        # Serialize the borrowed book data using your serializer
-        serializer = BorrowedBookSerializer(borrowed_books, many=True)
+def decremented(counter, amount=1):
+    # counter - amount, floored at 0 without going negative first (unsigned columns
+    # on MySQL), so a counter that drifted below the truth cannot fail the write
+    return Greatest(F(counter), amount) - amount
 
-        return Response(serializer.data)
 
 class ToggleFavoriteView(APIView):
     permission_classes = [IsAuthenticated]
+    @transaction.atomic
     def post(self, request, book_id):
-        try:
-            book = Book.objects.get(pk=book_id)
-            user = request.user
+        user = request.user
 
-            # Check if the book is already a favorite for the user
-            is_favorite = Favorite.objects.filter(user=user, book=book).exists()
+        # If already a favorite, the delete removes it and tells us so
+        removed, _ = Favorite.objects.filter(user=user, book_id=book_id).delete()
+        if removed:
+            Book.objects.filter(pk=book_id).update(favorite_count=decremented('favorite_count', removed))
+            record(availability_change(book_id), favorite_change(book_id, user.id, deleted=True))
+            count_activity(activity(book_id, user.id, favorites_removed=removed))
+            return Response({'message': 'Book removed from favorites'}, status=status.HTTP_200_OK)
 
-            if is_favorite:
-                # If already a favorite, remove it
-                Favorite.objects.filter(user=user, book=book).delete()
-                return Response({'message': 'Book removed from favorites'}, status=status.HTTP_200_OK)
-            else:
-                # If not a favorite, add it
-                Favorite.objects.create(user=user, book=book)
+        # If not a favorite, add it; the unique (user, book) constraint absorbs double taps
+        try:
+            with transaction.atomic():
+                Favorite.objects.create(user=user, book_id=book_id)
+        except IntegrityError:
+            # Only the unique constraint means "already added"; backends that check
+            # foreign keys at once fail here for a missing book
+            if Favorite.objects.filter(user=user, book_id=book_id).exists():
                 return Response({'message': 'Book added to favorites'}, status=status.HTTP_201_CREATED)
+            if not Book.objects.filter(pk=book_id).exists():
+                return Response({'message': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+            raise
 
-        except Book.DoesNotExist:
+        # Counting the favorite doubles as the check that the book exists
+        if not Book.objects.filter(pk=book_id).update(favorite_count=F('favorite_count') + 1):
+            transaction.set_rollback(True)
             return Response({'message': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+        record(availability_change(book_id), favorite_change(book_id, user.id))
+        count_activity(activity(book_id, user.id, favorites_added=1))
+        return Response({'message': 'Book added to favorites'}, status=status.HTTP_201_CREATED)
+
+
+class SyncFavoritesView(APIView):
+    permission_classes = [IsAuthenticated]
+    @transaction.atomic
+    def post(self, request):
+        # Apply a batch of favorite additions and removals, e.g. queued offline by the app
+        try:
+            add = {int(book_id) for book_id in request.data.get('add', [])}
+            remove = {int(book_id) for book_id in request.data.get('remove', [])} - add
+        except (TypeError, ValueError):
+            return Response({'message': '"add" and "remove" must be lists of book ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        user = request.user
+
+        # Locked, so these are exactly the rows this request deletes
+        removed = set(
+            Favorite.objects.select_for_update().filter(user=user, book_id__in=remove).values_list('book_id', flat=True)
+        )
+        if removed:
+            Favorite.objects.filter(user=user, book_id__in=removed).delete()
+            Book.objects.filter(pk__in=removed).update(favorite_count=decremented('favorite_count'))
+
+        existing_books = set(Book.objects.filter(pk__in=add).values_list('id', flat=True))
+        already = set(Favorite.objects.filter(user=user, book_id__in=existing_books).values_list('book_id', flat=True))
+        added = existing_books - already
+        if added:
+            Favorite.objects.bulk_create(
+                [Favorite(user=user, book_id=book_id) for book_id in added], ignore_conflicts=True
+            )
+            Book.objects.filter(pk__in=added).update(favorite_count=F('favorite_count') + 1)
+        record(
+            *[availability_change(book_id) for book_id in removed | added],
+            *[favorite_change(book_id, user.id, deleted=True) for book_id in removed],
+            *[favorite_change(book_id, user.id) for book_id in added],
+        )
+        count_activity(
+            *[activity(book_id, user.id, favorites_removed=1) for book_id in removed],
+            *[activity(book_id, user.id, favorites_added=1) for book_id in added],
+        )
+
+        return Response({
+            'added': sorted(added | already),
+            'removed': sorted(removed),
+            'not_found': sorted(add - existing_books),
+        }, status=status.HTTP_200_OK)
 
  
 class FavoritedBooksList(APIView):
+    permission_classes = [IsAuthenticated]
+    @conditional_get(lambda request: [CATALOG, favorites_key(request.user.id)])
     def get(self, request):
-        # get the user's object
-        user = get_object_or_404(CustomUser, id=request.user.id)
-
-        # Query for books favorited by the usera
-        favorited_books = Favorite.objects.select_related('book').filter(user=user)
-
-        # Serialize the favorited book data using your serializer
-        serializer = FavoritedBookSerializer(favorited_books, many=True)
+        user = request.user
+
+        # The user's favorites and their books come from the object cache,
+        # like the borrowed books
+        paginator = KeysetPagination()
+        favorites = object_cache.get_favorites(user.id)
+        if favorites is not None:
+            page = paginator.paginate_list(favorites, request, Favorite)
+        else:
+            favorited_books = Favorite.objects.filter(user=user).values('id', 'book_id')
+            page = paginator.paginate_queryset(favorited_books, request, ordering=('-id',))
 
-        return Response(serializer.data)
+        unchanged = not_modified(request, [favorite['book_id'] for favorite in page])
+        if unchanged is not None:
+            return unchanged
+        # Same rows as FavoritedBookSerializer, without its per-object machinery
+        rows = BookRows()
+        return paginator.get_paginated_response([{'book': rows.embedded(book)} for book in cached_books(page, key='book_id')])
 
 
 class BorrowBookView(APIView):
     permission_classes = [IsAuthenticated]
     @transaction.atomic
     def post(self, request, book_id):
+        # Decrement the book's quantity only if one is left, in a single UPDATE,
+        # so concurrent borrows can never push the stock below zero
+        in_stock = Book.objects.filter(pk=book_id, quantity__gt=0).update(
+            quantity=F('quantity') - 1,
+            on_loan=F('on_loan') + 1,
+            total_borrows=F('total_borrows') + 1,
+        )
+        if in_stock:
+            borrow = Borrow.objects.create(
+                user=request.user,
+                book_id=book_id,
+                borrowed_date=datetime.date.today(),
+                quantity_borrowed=1,  # this Sets the quantity borrowed
+            )
+            record(availability_change(book_id), borrow_change(borrow.id, request.user.id))
+            count_activity(activity(book_id, request.user.id, borrows=1))
+            return Response({'message': 'Book borrowed successfully.'}, status=status.HTTP_200_OK)
+        elif Book.objects.filter(pk=book_id).exists():
+            return Response({'message': 'Book out of stock.'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({'message': 'Book not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+class ReturnBookView(APIView):
+    permission_classes = [IsAuthenticated]
+    @transaction.atomic
+    def post(self, request, book_id):
+        # Close the user's oldest open loan of this book; a concurrent return may
+        # close it first, in which case the next open loan is taken
+        open_loans = Borrow.objects.filter(user=request.user, book_id=book_id, return_date__isnull=True)
+        taken = []
+        while True:
+            borrow = (
+                open_loans.exclude(pk__in=taken)
+                .order_by('borrowed_date', 'id')
+                .only('id', 'quantity_borrowed')
+                .first()
+            )
+            if borrow is None:
+                if taken:
+                    return Response({'message': 'Book already returned.'}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({'message': 'No open loan for this book.'}, status=status.HTTP_404_NOT_FOUND)
+
+            # The return_date condition makes a concurrent double return a no-op
+            closed = Borrow.objects.filter(pk=borrow.pk, return_date__isnull=True).update(
+                return_date=datetime.date.today()
+            )
+            if closed:
+                break
+            taken.append(borrow.pk)
+
+        Book.objects.filter(pk=book_id).update(
+            quantity=F('quantity') + borrow.quantity_borrowed,
+            on_loan=decremented('on_loan', borrow.quantity_borrowed),
+        )
+        record(availability_change(book_id), borrow_change(borrow.id, request.user.id))
+        count_activity(activity(book_id, request.user.id, returns=1))
+        return Response({'message': 'Book returned successfully.'}, status=status.HTTP_200_OK)
+
+class SyncView(APIView):
+    """
+    Delta sync: GET /sync/?since=<token> returns what changed in the catalog
+    and in the caller's loans and favorites after `token` (0 for everything),
+    with the ids of deleted rows as tombstones. Loans and favorites of a
+    deleted book go with it. Follow `token` while `has_more` is true.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request):
         try:
-            book = Book.objects.get(pk=book_id)
-            if book.quantity > 0:
-                borrow = Borrow(
-                    user=request.user,
-                    book=book,
-                    borrowed_date=datetime.date.today(),
-                    quantity_borrowed=1,  # this Sets the quantity borrowed
-                )
-                borrow.save()
-
-                # Decrement the book's quantity
-                book.quantity -= borrow.quantity_borrowed
-                book.save()
+            since = int(request.GET.get('since', 0))
+            limit = min(int(request.GET.get('limit', self.default_limit)), self.max_limit)
+            if since < 0 or limit <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({'message': '"since" and "limit" must be non-negative integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries, has_more = changes_since(request.user, since, limit)
+        states = latest_states(entries)
+        changed = {kind: [object_id for object_id, deleted in objects.items() if not deleted] for kind, objects in states.items()}
+
+        # Rows changed and then removed later on read as deleted
+        books = Book.objects.in_bulk(changed['book']) if changed['book'] else {}
+        borrows = Borrow.objects.filter(user=request.user, id__in=changed['borrow']) if changed['borrow'] else []
+        favorites = set(
+            Favorite.objects.filter(user=request.user, book_id__in=changed['favorite']).values_list('book_id', flat=True)
+        ) if changed['favorite'] else set()
+        borrows = BorrowSyncSerializer(borrows, many=True).data
+
+        def deleted(kind, present):
+            return sorted(object_id for object_id in states[kind] if object_id not in present)
+
+        return Response({
+            'token': str(entries[-1].id if entries else since),
+            'has_more': has_more,
+            'books': BookSerializer(list(books.values()), many=True).data,
+            'deleted_books': deleted('book', books),
+            'borrows': borrows,
+            'deleted_borrows': deleted('borrow', {borrow['id'] for borrow in borrows}),
+            'favorites': sorted(favorites),
+            'deleted_favorites': deleted('favorite', favorites),
+        }, status=status.HTTP_200_OK)
+
+async def availability_stream(request):
+    """
+    Server-Sent Events stream of availability changes for ?books=1,2,3.
+    Sends the current quantity / on_loan of each book, then one event per
+    change; a `resync` event means events were dropped and the client should
+    refetch. Streams end after MAX_DURATION and clients reconnect. Needs an
+    ASGI server (see library_project/asgi.py).
+    """
+    try:
+        authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as error:
+        return JsonResponse({'message': str(error.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse({'message': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        book_ids = {int(book_id) for book_id in request.GET.get('books', '').split(',') if book_id}
+    except ValueError:
+        book_ids = set()
+    if not book_ids or len(book_ids) > live_setting('MAX_BOOKS'):
+        return JsonResponse(
+            {'message': f'"books" must list 1 to {live_setting("MAX_BOOKS")} book ids.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    broker = get_broker()
+    # Subscribe before reading the snapshot so no change falls in between
+    subscription = broker.subscribe(book_ids)
+
+    async def events():
+        try:
+            yield 'retry: 3000\n\n'
+            for row in await sync_to_async(availability)(book_ids):
+                yield sse('availability', row)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + live_setting('MAX_DURATION')
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await subscription.get(min(live_setting('HEARTBEAT'), remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is CLOSED:
+                    return
+                yield sse('resync', {}) if event is RESYNC else sse('availability', event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    # Closing the response drops the subscription, even with events() left suspended
+    response = StreamingHttpResponse(EventStream(events(), broker, subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class StatsView(APIView):
+    """
+    Library statistics from the rollup tables: GET /stats/?period=day&buckets=30&top=10
+    returns the running totals, a per-hour or per-day series with open loans,
+    the most borrowed books of the window and the caller's own loans in it.
+    """
+    permission_classes = [IsAuthenticated]
+    default_buckets = {HOUR: 24, DAY: 30}
 
-                return Response({'message': 'Book borrowed successfully.'}, status=status.HTTP_200_OK)
-            else:
-                return Response({'message': 'Book out of stock.'}, status=status.HTTP_400_BAD_REQUEST)
-        except Book.DoesNotExist:
-            return Response({'message': 'Book not found.'}, status=status.HTTP_404_NOT_FOUND)
+    def get(self, request):
+        period = request.GET.get('period', DAY)
+        if period not in (HOUR, DAY):
+            return Response({'message': 'period must be "hour" or "day".'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            buckets = int(request.GET.get('buckets', self.default_buckets[period]))
+            top = int(request.GET.get('top', 10))
+            if not 0 < buckets <= MAX_BUCKETS[period] or not 0 <= top <= MAX_TOP:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'message': f'buckets must be 1-{MAX_BUCKETS[period]} and top 0-{MAX_TOP}.',
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        totals, series, popular, user = summary(period, buckets, top, user_id=request.user.id)
+        rows = BookRows()
+        books = object_cache.get_books([book_id for book_id, _ in popular])
+        return Response({
+            'period': period,
+            'totals': totals,
+            'series': [{**point, 'bucket': rows.datetime(point['bucket'])} for point in series],
+            'popular': [
+                {'book': rows.embedded(books[book_id]), 'borrows': borrows}
+                for book_id, borrows in popular if book_id in books
+            ],
+            'user': user,
+        }, status=status.HTTP_200_OK)
+
+class ObjectCacheStats(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        # Hit / miss counters of this process's object cache, for tuning TTLs and sizes
+        return Response(object_cache.stats, status=status.HTTP_200_OK)
+
+class MetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        # Per-endpoint histograms of this process, in the Prometheus text format
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class AddBookByISBN(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         isbn = request.data.get('isbn')
-        
+        isbn = clean_isbn(isbn) if isinstance(isbn, str) else ''
+        if not ISBN_RE.match(isbn):
+            return Response({'message': 'A valid ISBN-10 or ISBN-13 is required'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Vérifiez si le livre existe déjà
         book = Book.objects.filter(isbn=isbn).first()
         if not book:
             # Récupérer les informations via l'API Google Books
-            book_info = get_book_info_from_google(isbn)
+            try:
+                book_info = get_book_info_from_google(isbn, raise_errors=True)
+            except GoogleBooksError:
+                return Response({'message': 'Google Books is unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             if book_info:
-                # Créer un livre avec l'ISBN seulement
-                book = Book.objects.create(isbn=isbn)
-                # Vous pouvez ajouter les informations supplémentaires ici si nécessaire
-                # Par exemple, vous pouvez stocker ou simplement renvoyer les infos de Google Books
+                # Créer le livre avec les métadonnées de Google Books
+                book = Book(isbn=isbn)
+                book.apply_book_info(book_info)
+                book.save()
                 return Response(book_info, status=status.HTTP_201_CREATED)
             else:
                 return Response({'message': 'Book not found in Google Books API'}, status=status.HTTP_404_NOT_FOUND)
         else:
             return Response({'message': 'Book already exists'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BulkAddBooksByISBN(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def post(self, request):
+        # Accept either an uploaded CSV / newline-delimited file or a JSON list of ISBNs
+        if 'file' in request.FILES:
+            lines = request.FILES['file']
+        elif isinstance(request.data.get('isbns'), list):
+            lines = request.data['isbns']
+        else:
+            return Response({'message': 'Provide a "file" upload or an "isbns" list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            quantity = int(request.data.get('quantity', 1))
+            if quantity < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'message': 'quantity must be a non-negative integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Stream one JSON line per ISBN so large uploads are never held in memory
+        report = (json.dumps(result) + '\n' for result in import_isbns(lines, quantity=quantity))
+        return StreamingHttpResponse(report, content_type='application/x-ndjson')
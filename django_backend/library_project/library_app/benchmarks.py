@@ -0,0 +1,318 @@
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from library_app.api.images import generate_renditions
+from library_app.api.pagination import KeysetPagination
+from library_app.api.renderers import FastJSONRenderer
+from library_app.api.search import index_books, search_books
+from library_app.api.serializers import BOOK_COLUMNS, BookRows, BookSerializer, BorrowedBookSerializer
+from library_app.api.sorting import sort_books
+from library_app.api.token_blacklist import blacklist_filter
+from library_app.api.views import BookList, BorrowBookView
+from library_app.models import Book, Borrow, CustomUser
+
+# Benchmark scenarios run by `manage.py benchmark <name>`. Each scenario is a
+# function taking (sizes, repeat, write) and seeds the rows it needs; the
+# command wraps every run in a transaction that is rolled back afterwards.
+# Multi-threaded scenarios need committed rows, so they opt out and the
+# command runs them against a throwaway test database instead.
+SCENARIOS = {}
+
+
+def scenario(func=None, transactional=True):
+    def register(func):
+        func.transactional = transactional
+        SCENARIOS[func.__name__] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def timed(func, repeat):
+    # Median wall time of `repeat` calls, in milliseconds
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'ba', 'de', 'fu', 'go', 'ha', 'je', 'po']
+
+
+def word(number):
+    # Deterministic pseudo-word, so every run seeds the same vocabulary
+    letters = []
+    for _ in range(3):
+        number, digit = divmod(number, len(SYLLABLES))
+        letters.append(SYLLABLES[digit])
+    return ''.join(letters)
+
+
+def seed_books(count, batch_size=5000, index=False):
+    # Grow the Book table to `count` rows with synthetic titles and ISBNs
+    existing = Book.objects.count()
+    for start in range(existing, count, batch_size):
+        books = Book.objects.bulk_create([
+            Book(
+                title=f'{word(number * 7 % 4093).title()} {word(number * 13 % 4091)} {word(number % 4079)}',
+                author=f'{word(number % 997).title()} {word(number % 389).title()}',
+                isbn=f'{number:013d}',
+                quantity=number % 5,
+            )
+            for number in range(start, min(start + batch_size, count))
+        ])
+        if index:
+            index_books(books)
+
+
+def bench_user():
+    user, _ = CustomUser.objects.get_or_create(
+        user_name='benchmark', defaults={'email': 'bench@example.com', 'first_name': 'Bench', 'last_name': 'Mark'}
+    )
+    return user
+
+
+def call_view(view, path, user, method='get', headers=None, **kwargs):
+    request = getattr(APIRequestFactory(), method)(path, **(headers or {}))
+    force_authenticate(request, user=user)
+    response = view(request, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+@scenario
+def pagination(sizes, repeat, write):
+    """First-page and deep-page latency of /books/ as the catalog grows."""
+    view = BookList.as_view()
+    user = bench_user()
+    write(f'{"rows":>10} {"first page ms":>14} {"deep page ms":>13}')
+    for size in sizes:
+        seed_books(size)
+        # Walk to roughly the middle of the table to get a deep cursor
+        middle = Book.objects.order_by('-inserted_date', '-id')[size // 2]
+        paginator = KeysetPagination()
+        paginator.ordering = paginator.get_ordering(('-inserted_date', '-id'))
+        cursor = paginator.encode_cursor(middle)
+
+        first = timed(lambda: call_view(view, '/books/', user), repeat)
+        deep = timed(lambda: call_view(view, f'/books/?cursor={cursor}', user), repeat)
+        write(f'{size:>10} {first:>14.2f} {deep:>13.2f}')
+
+
+@scenario
+def search(sizes, repeat, write):
+    """Full-text index lookups against the icontains scan they replaced."""
+    queries = [word(42), f'{word(42)} {word(1234)[:3]}', word(7)[:4]]
+    write(f'{"rows":>10} {"query":>12} {"icontains ms":>13} {"index ms":>9}')
+    for size in sizes:
+        seed_books(size, index=True)
+        for query in queries:
+            scan = timed(lambda: list(Book.objects.filter(
+                Q(author__icontains=query) | Q(title__icontains=query) | Q(isbn=query)
+            ).order_by('-id')[:20]), repeat)
+            indexed = timed(lambda: list(search_books(query).order_by('-score', '-book')[:20]), repeat)
+            write(f'{size:>10} {query:>12} {scan:>13.2f} {indexed:>9.2f}')
+
+
+# Above this the quadratic baseline would run for hours; its column is left blank
+INSERTION_SORT_MAX_ROWS = 10000
+
+
+def insertion_sort_by_isbn(books):
+    # The quadratic sort SearchBook used to carry, kept here as the baseline
+    books = list(books)
+    for i in range(1, len(books)):
+        key = books[i]
+        j = i - 1
+        while j >= 0 and key.isbn < books[j].isbn:
+            books[j + 1] = books[j]
+            j -= 1
+        books[j + 1] = key
+    return books
+
+
+@scenario
+def sorting(sizes, repeat, write):
+    """In-Python quadratic sort vs key-based sort vs indexed ORDER BY ... LIMIT."""
+    write(f'{"rows":>10} {"insertion ms":>13} {"sorted() ms":>12} {"db page ms":>11}')
+    for size in sizes:
+        seed_books(size)
+        # Load in title order so the ISBN sort has real work to do
+        books = list(Book.objects.order_by('title', 'id')[:size])
+        quadratic = '-'
+        if size <= INSERTION_SORT_MAX_ROWS:
+            quadratic = f'{timed(lambda: insertion_sort_by_isbn(books), 1):.2f}'
+        keyed = timed(lambda: sort_books(books, 'isbn'), repeat)
+        database = timed(lambda: list(Book.objects.order_by('isbn', 'id')[:20]), repeat)
+        write(f'{size:>10} {quadratic:>13} {keyed:>12.2f} {database:>11.2f}')
+
+
+@scenario(transactional=False)
+def borrow(sizes, repeat, write):
+    """Concurrent borrows of one title: throughput, and proof stock stays >= 0."""
+    view = BorrowBookView.as_view()
+    # A user of its own, never an existing account that happens to share a name
+    user = CustomUser.objects.create(
+        user_name=f'benchmark-{uuid.uuid4().hex[:12]}', email='bench@example.com', first_name='Bench', last_name='Mark',
+    )
+    write(f'{"threads":>10} {"attempts":>9} {"borrowed":>9} {"borrows/s":>10} {"stock":>6}')
+    for threads in sizes:
+        attempts = threads * repeat
+        # Less stock than attempts, so the out-of-stock path is exercised too
+        book = Book.objects.create(
+            title='Benchmark', author='Benchmark', isbn='BENCH-BORROW', quantity=attempts // 2
+        )
+        statuses = []
+
+        def worker():
+            try:
+                for _ in range(repeat):
+                    response = call_view(view, f'/borrow/{book.id}/', user, method='post', book_id=book.id)
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        book.refresh_from_db()
+        borrowed = Borrow.objects.filter(book=book).count()
+        write(f'{threads:>10} {attempts:>9} {borrowed:>9} {len(statuses) / elapsed:>10.1f} {book.quantity:>6}')
+        book.delete()
+    user.delete()
+
+
+@scenario
+def covers(sizes, repeat, write):
+    """Image bytes a client downloads per /books/ page: originals vs renditions."""
+    source = os.path.join(settings.MEDIA_ROOT, 'Images', 'BooksCover')
+    # Skip renditions a backfill may already have written next to the originals
+    originals = sorted(name for name in os.listdir(source) if name.count('.') == 1)
+    media_root = tempfile.mkdtemp()
+    try:
+        # Render into a scratch MEDIA_ROOT so the real media folder is untouched
+        with override_settings(MEDIA_ROOT=media_root):
+            shutil.copytree(source, os.path.join(media_root, 'Images', 'BooksCover'))
+            renditions = {}
+            for name in originals:
+                field = Book(cover_image=f'Images/BooksCover/{name}').cover_image
+                renditions[name] = generate_renditions(field)
+
+            write(f'{"page size":>10} {"original KB":>12} {"small jpeg KB":>14} {"small webp KB":>14}')
+            for page_size in sizes:
+                page = [originals[number % len(originals)] for number in range(page_size)]
+                original = sum(default_storage.size(f'Images/BooksCover/{name}') for name in page)
+                jpeg = sum(default_storage.size(renditions[name]['small']['jpeg']) for name in page)
+                webp = sum(default_storage.size(renditions[name]['small']['webp']) for name in page)
+                write(f'{page_size:>10} {original / 1024:>12.1f} {jpeg / 1024:>14.1f} {webp / 1024:>14.1f}')
+    finally:
+        shutil.rmtree(media_root)
+
+
+@scenario
+def polling(sizes, repeat, write):
+    """Repeated /books/ polls of an unchanged catalog, with and without If-None-Match."""
+    view = BookList.as_view()
+    user = bench_user()
+    path = '/books/?page_size=100'
+    write(f'{"rows":>10} {"full ms":>8} {"full bytes":>11} {"304 ms":>7} {"304 bytes":>10}')
+    for size in sizes:
+        seed_books(size)
+        etag = call_view(view, path, user)['ETag']
+        full = call_view(view, path, user)
+        revalidated = call_view(view, path, user, headers={'HTTP_IF_NONE_MATCH': etag})
+        assert revalidated.status_code == 304
+        full_ms = timed(lambda: call_view(view, path, user), repeat)
+        cached_ms = timed(lambda: call_view(view, path, user, headers={'HTTP_IF_NONE_MATCH': etag}), repeat)
+        write(f'{size:>10} {full_ms:>8.2f} {len(full.content):>11} {cached_ms:>7.2f} {len(revalidated.content):>10}')
+
+
+@scenario
+def serializers(sizes, repeat, write):
+    """Rows/s rendered to JSON by the model serializers vs the lean BookRows path."""
+    write(f'{"rows":>10} {"path":>9} {"serializer rows/s":>18} {"lean rows/s":>12}')
+    for size in sizes:
+        seed_books(size)
+        books = list(Book.objects.order_by('id')[:size])
+        rows = list(Book.objects.order_by('id').values(*BOOK_COLUMNS)[:size])
+        # Unsaved loans are enough for BorrowedBookSerializer, which only reads .book
+        loans = [Borrow(book=book) for book in books]
+
+        def lean_books():
+            book_rows = BookRows()
+            FastJSONRenderer().render([book_rows.full(row) for row in rows])
+
+        def lean_loans():
+            book_rows = BookRows()
+            FastJSONRenderer().render([{'book': book_rows.embedded(row)} for row in rows])
+
+        for path, serialized, lean in (
+            ('books', lambda: JSONRenderer().render(BookSerializer(books, many=True).data), lean_books),
+            ('borrowed', lambda: JSONRenderer().render(BorrowedBookSerializer(loans, many=True).data), lean_loans),
+        ):
+            serialized_ms = timed(serialized, repeat)
+            lean_ms = timed(lean, repeat)
+            write(f'{size:>10} {path:>9} {size / serialized_ms * 1000:>18.0f} {size / lean_ms * 1000:>12.0f}')
+
+
+def seed_tokens(count, user, batch_size=5000):
+    # Grow the outstanding refresh tokens to `count`, every other one blacklisted
+    existing = OutstandingToken.objects.count()
+    expires_at = timezone.now() + timedelta(days=30)
+    for start in range(existing, count, batch_size):
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=uuid.uuid4().hex, token='', expires_at=expires_at)
+            for _ in range(start, min(start + batch_size, count))
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens[::2]])
+
+
+@scenario
+def refresh(sizes, repeat, write):
+    """Refresh-token rotations/s as the token tables grow, with and without the blacklist prefilter."""
+    view = TokenRefreshView.as_view()
+    user = bench_user()
+    write(f'{"tokens":>10} {"prefilter":>10} {"refresh/s":>10} {"queries":>8} {"filter load ms":>15}')
+    for size in sizes:
+        seed_tokens(size, user)
+        for prefilter in (False, True):
+            blacklist_filter.reset()
+            with override_settings(TOKEN_BLACKLIST={**getattr(settings, 'TOKEN_BLACKLIST', {}), 'PREFILTER': prefilter}):
+                load_started = time.perf_counter()
+                if prefilter:
+                    blacklist_filter.might_contain('')
+                load_ms = (time.perf_counter() - load_started) * 1000
+                tokens = [str(RefreshToken.for_user(user)) for _ in range(repeat)]
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    for token in tokens:
+                        request = APIRequestFactory().post('/api/token/refresh/', {'refresh': token}, format='json')
+                        assert view(request).status_code == 200
+                elapsed = time.perf_counter() - started
+            write(f'{size:>10} {str(prefilter):>10} {repeat / elapsed:>10.1f} {len(queries) / repeat:>8.1f} {load_ms:>15.1f}')
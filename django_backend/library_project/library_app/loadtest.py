@@ -0,0 +1,225 @@
+import datetime
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from library_app.api.object_cache import object_cache
+from library_app.benchmarks import seed_books, word
+from library_app.models import Book, Borrow, CustomUser, Favorite
+
+# Load test of the API endpoints, run by `manage.py loadtest`. Every endpoint
+# is driven through the full middleware stack by concurrent clients, each
+# signed in as its own seeded user, against a throwaway test database.
+
+
+class StubGoogleBooksServer:
+    """Local stand-in for the Google Books volumes endpoint."""
+
+    def __init__(self, volumes=None, failing=()):
+        self.volumes = volumes or {}
+        self.failing = set(failing)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+                stub.requests.append(query)
+                # `isbn:A` or a batch `isbn:A OR isbn:B`
+                isbns = [term.replace('isbn:', '') for term in query.split(' OR ')]
+                if stub.failing.intersection(isbns):
+                    self.send_error(503)
+                    return
+                items = [
+                    {'volumeInfo': {
+                        'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': isbn}],
+                        **stub.volumes[isbn],
+                    }}
+                    for isbn in isbns if isbn in stub.volumes
+                ]
+                body = {'totalItems': len(items), 'items': items} if items else {'totalItems': 0}
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}/books/v1/volumes'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def seed_users(count, batch_size=5000):
+    # Grow the load-test users to `count`; unusable passwords skip the hashing
+    existing = CustomUser.objects.filter(user_name__startswith='load').count()
+    for start in range(existing, count, batch_size):
+        users = []
+        for number in range(start, min(start + batch_size, count)):
+            user = CustomUser(
+                user_name=f'load{number}', email=f'load{number}@example.com', first_name='Load', last_name='Test',
+            )
+            user.set_unusable_password()
+            users.append(user)
+        CustomUser.objects.bulk_create(users)
+    return list(CustomUser.objects.filter(user_name__startswith='load').order_by('id')[:count])
+
+
+def seed_library(books, users, loans_per_user=5, favorites_per_user=5):
+    """
+    Seed `books` indexed books and `users` users, each with a loan history
+    and favorites. Growing an existing data set only adds the missing rows.
+    """
+    seed_books(books, index=True)
+    readers = seed_users(users)
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:books])
+    today = datetime.date.today()
+    picker = random.Random(books)
+    for reader in readers:
+        if Borrow.objects.filter(user=reader).exists():
+            continue
+        Borrow.objects.bulk_create([
+            Borrow(
+                user=reader,
+                book_id=picker.choice(book_ids),
+                borrowed_date=today - datetime.timedelta(days=day),
+            )
+            for day in range(loans_per_user)
+        ])
+        Favorite.objects.bulk_create(
+            [Favorite(user=reader, book_id=book_id) for book_id in picker.sample(book_ids, min(favorites_per_user, len(book_ids)))],
+            ignore_conflicts=True,
+        )
+    return readers, book_ids
+
+
+def endpoints(book_ids):
+    # name: (method, path(picker)); ISBN searches go to the Google Books stub
+    return {
+        'books': ('get', lambda picker: '/books/'),
+        'search': ('get', lambda picker: f'/search/?query={word(picker.randrange(4079))}'),
+        'search-isbn': ('get', lambda picker: f'/search/?query={picker.randrange(10 ** 12):013d}'),
+        'borrow': ('post', lambda picker: f'/borrow/{picker.choice(book_ids)}/'),
+        'favorite': ('post', lambda picker: f'/favorite/{picker.choice(book_ids)}/'),
+        'borrowed-books': ('get', lambda picker: '/borrowed-books/'),
+        'favorited-books': ('get', lambda picker: '/favorited-books/'),
+    }
+
+
+def percentile(samples, share):
+    # Nearest-rank percentile of sorted samples
+    return samples[min(len(samples) - 1, int(share * len(samples)))]
+
+
+def drive(method, path, readers, threads, requests_per_thread):
+    """
+    Run `threads` clients, each sending `requests_per_thread` requests as
+    its own user, and summarize latency (ms), throughput and queries.
+    """
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(number):
+        api = APIClient()
+        api.force_authenticate(readers[number % len(readers)])
+        picker = random.Random(number)
+        mine, counts, failed = [], [], 0
+        try:
+            for _ in range(requests_per_thread):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(api, method)(path(picker))
+                    mine.append((time.perf_counter() - started) * 1000)
+                counts.append(len(captured))
+                # Out of stock and unknown ISBNs are expected answers, not failures
+                if response.status_code >= 500:
+                    failed += 1
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(mine)
+            queries.extend(counts)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(number,)) for number in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def run(sizes, threads, requests_per_thread, users, write):
+    """
+    Seed each data size in turn and drive every endpoint against it.
+    Returns {size: {endpoint: summary}}, the shape of the JSON baseline.
+    """
+    results = {}
+    write(f'{"books":>8} {"endpoint":>16} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8} {"queries":>8} {"errors":>7}')
+    for size in sizes:
+        readers, book_ids = seed_library(size, users)
+        # Start every size from a cold object cache
+        object_cache.clear()
+        results[str(size)] = {}
+        for name, (method, path) in endpoints(book_ids).items():
+            summary = drive(method, path, readers, threads, requests_per_thread)
+            results[str(size)][name] = summary
+            write(
+                f'{size:>8} {name:>16} {summary["p50_ms"]:>8.2f} {summary["p95_ms"]:>8.2f} {summary["p99_ms"]:>8.2f} '
+                f'{summary["throughput_rps"]:>8.1f} {summary["queries_mean"]:>8.2f} {summary["errors"]:>7}'
+            )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of `results` against a baseline of the same shape: p95
+    latency or mean query count more than `tolerance` (a ratio) above it.
+    """
+    regressions = []
+    for size, endpoints_run in results.items():
+        for name, summary in endpoints_run.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if summary['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{size} {name}: p95 {before["p95_ms"]} -> {summary["p95_ms"]} ms')
+            if summary['queries_mean'] > before['queries_mean'] * (1 + tolerance):
+                regressions.append(f'{size} {name}: queries {before["queries_mean"]} -> {summary["queries_mean"]}')
+    return regressions
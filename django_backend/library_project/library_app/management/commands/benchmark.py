@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from library_app.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against synthetic data. All seeded rows are rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Scenario to run.')
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated data sizes.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per measurement.')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+
+        scenario = SCENARIOS[options['scenario']]
+        if not scenario.transactional:
+            # Its threads commit, so it gets a database of its own, like the load test
+            if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'library_benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                scenario(sizes, options['repeat'], self.stdout.write)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            return
+        with transaction.atomic():
+            scenario(sizes, options['repeat'], self.stdout.write)
+            transaction.set_rollback(True)
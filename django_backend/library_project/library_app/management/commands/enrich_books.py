@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from library_app.api.google_books import RateLimiter, google_books_setting, lookup_many
+from library_app.api.search import index_books
+from library_app.api.changes import book_change, record
+from library_app.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Fill in missing or stale Google Books metadata on Book rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent Google Books requests.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Books processed per batch.')
+        parser.add_argument('--after-id', type=int, default=0, help='Resume after this Book id.')
+        parser.add_argument('--rate', type=float, default=None, help='Requests per second per host.')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many books.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        rate = options['rate'] if options['rate'] is not None else google_books_setting('RATE_LIMIT')
+        rate_limiter = RateLimiter(rate)
+
+        stale_before = timezone.now() - google_books_setting('CACHE_TTL')
+        books = Book.objects.filter(
+            Q(metadata_updated_at__isnull=True) | Q(metadata_updated_at__lt=stale_before)
+        ).order_by('id')
+
+        cursor = options['after_id']
+        processed = enriched = not_found = errors = 0
+        started = time.monotonic()
+
+        while options['limit'] is None or processed < options['limit']:
+            batch_size = options['batch_size']
+            if options['limit'] is not None:
+                batch_size = min(batch_size, options['limit'] - processed)
+            batch = list(books.filter(id__gt=cursor)[:batch_size])
+            if not batch:
+                break
+
+            results, failures = lookup_many([book.isbn for book in batch], workers=workers, rate_limiter=rate_limiter)
+
+            updated = []
+            for book in batch:
+                if book.isbn in failures:
+                    errors += 1
+                    self.stderr.write(f'{book.isbn}: {failures[book.isbn]}')
+                    continue
+                book_info = results.get(book.isbn)
+                if book_info:
+                    book.apply_book_info(book_info)
+                    enriched += 1
+                else:
+                    # Remember the miss so the book is only retried once stale
+                    book.metadata_updated_at = timezone.now()
+                    not_found += 1
+                updated.append(book)
+
+            Book.objects.bulk_update(updated, [
+                'title', 'author', 'publisher', 'published_date', 'description',
+                'thumbnail_url', 'metadata_updated_at',
+            ])
+            index_books(updated)
+            record(*[book_change(book.id) for book in updated])
+
+            processed += len(batch)
+            cursor = batch[-1].id
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'cursor={cursor} processed={processed} errors={errors} '
+                f'rate={processed / elapsed if elapsed else 0:.1f} isbn/s'
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} books in {elapsed:.1f}s '
+            f'({processed / elapsed if elapsed else 0:.1f} isbn/s), '
+            f'{enriched} enriched, {not_found} not found, {errors} errors. Last id: {cursor}'
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from library_app.api.images import generate_renditions, renditions_are_current
+from library_app.api.changes import book_change, record
+from library_app.models import Book, CustomUser
+
+TARGETS = (
+    (Book, 'cover_image', 'cover_renditions'),
+    (CustomUser, 'profile_image', 'profile_image_renditions'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate the small/medium/large JPEG and WebP renditions of existing covers and profile images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows loaded per batch.')
+        parser.add_argument('--force', action='store_true', help='Re-render rows that already have renditions.')
+
+    def handle(self, *args, **options):
+        for model, image_field, renditions_field in TARGETS:
+            rendered = skipped = failed = 0
+            cursor = 0
+            rows = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True}).order_by('id')
+            while True:
+                batch = list(rows.filter(id__gt=cursor).only('id', image_field, renditions_field)[:options['batch_size']])
+                if not batch:
+                    break
+                updated = []
+                for instance in batch:
+                    field_file = getattr(instance, image_field)
+                    if not options['force'] and renditions_are_current(field_file, getattr(instance, renditions_field)):
+                        skipped += 1
+                        continue
+                    try:
+                        setattr(instance, renditions_field, generate_renditions(field_file))
+                    except OSError as error:
+                        failed += 1
+                        self.stderr.write(f'{model.__name__} {instance.pk}: {error}')
+                        continue
+                    updated.append(instance)
+                    rendered += 1
+                model.objects.bulk_update(updated, [renditions_field])
+                if model is Book:
+                    record(*[book_change(book.id) for book in updated])
+                cursor = batch[-1].id
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: {rendered} rendered, {skipped} already current, {failed} failed.'
+            ))
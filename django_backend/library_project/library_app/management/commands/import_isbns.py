@@ -0,0 +1,38 @@
+import json
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.api.bulk_import import import_isbns
+
+
+class Command(BaseCommand):
+    help = 'Create books from a CSV or newline-delimited list of ISBNs and print a per-ISBN report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, or "-" for standard input.')
+        parser.add_argument('--quantity', type=int, default=1, help='Stock for rows without a quantity column.')
+        parser.add_argument('--batch-size', type=int, default=500, help='ISBNs per lookup and insert batch.')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent Google Books requests.')
+
+    def handle(self, *args, **options):
+        if options['quantity'] < 0:
+            raise CommandError('--quantity must not be negative.')
+        source = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        counts = Counter()
+        try:
+            for result in import_isbns(
+                source,
+                quantity=options['quantity'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+            ):
+                counts[result['status']] += 1
+                self.stdout.write(json.dumps(result))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+        self.stderr.write(f'Imported {sum(counts.values())} rows: {summary or "nothing to do"}')
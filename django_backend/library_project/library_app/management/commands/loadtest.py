@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from library_app.loadtest import StubGoogleBooksServer, compare, run
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive every API endpoint with concurrent clients against a seeded test database and report '
+        'p50/p95/p99 latency, throughput and query counts, optionally against a JSON baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help='Comma-separated numbers of books to seed.')
+        parser.add_argument('--users', type=int, default=50, help='Seeded users; clients take turns signing in as them.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients per endpoint.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client and endpoint.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression over the baseline, as a ratio.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database, and its seeded rows, between runs.')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        # Concurrent clients need committed rows, so the run gets its own
+        # database; an in-memory SQLite one would serialize every writer
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'library_loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with StubGoogleBooksServer() as server, override_settings(GOOGLE_BOOKS={
+                'API_URL': server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0,
+            }):
+                results = run(sizes, options['threads'], options['requests'], options['users'], self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressed against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regression against the baseline.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from library_app.api.token_blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired refresh tokens and their blacklist entries in bounded batches. Run it on a schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tokens deleted per batch.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        deleted = 0
+        for count in prune_expired_tokens(options['batch_size'], options['pause']):
+            deleted += count
+            self.stdout.write(f'Deleted {deleted} expired tokens')
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} expired tokens.'))
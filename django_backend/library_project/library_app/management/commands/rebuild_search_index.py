@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from library_app.api.search import index_books
+from library_app.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the book search index from the Book table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books indexed per batch.')
+
+    def handle(self, *args, **options):
+        cursor = 0
+        indexed = 0
+        while True:
+            batch = list(Book.objects.filter(id__gt=cursor).order_by('id')[:options['batch_size']])
+            if not batch:
+                break
+            index_books(batch)
+            indexed += len(batch)
+            cursor = batch[-1].id
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} books.'))
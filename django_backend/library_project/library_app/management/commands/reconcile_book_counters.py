@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from library_app.api.book_counters import COUNTERS, with_actual_counters
+from library_app.api.changes import availability_change, record
+from library_app.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute the on_loan, total_borrows and favorite_count counters on Book and report drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books checked per batch.')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        cursor = 0
+        checked = 0
+        drifted = []
+        while True:
+            batch = list(
+                with_actual_counters(Book.objects.filter(id__gt=cursor).order_by('id'))
+                .only('id', 'isbn', *COUNTERS)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            fixes = []
+            for book in batch:
+                drift = {
+                    counter: (getattr(book, counter), getattr(book, f'actual_{counter}'))
+                    for counter in COUNTERS
+                    if getattr(book, counter) != getattr(book, f'actual_{counter}')
+                }
+                if drift:
+                    drifted.append(book)
+                    details = ', '.join(f'{counter} {stored} -> {actual}' for counter, (stored, actual) in drift.items())
+                    self.stdout.write(f'{book.isbn}: {details}')
+                    for counter, (_, actual) in drift.items():
+                        setattr(book, counter, actual)
+                    fixes.append(book)
+            if fixes and not options['dry_run']:
+                Book.objects.bulk_update(fixes, COUNTERS)
+                record(*[availability_change(book.id) for book in fixes])
+            checked += len(batch)
+            cursor = batch[-1].id
+
+        verb = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} books, {verb} drift on {len(drifted)}.'))
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0002_book_favorite_borrow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleBookCache',
+            fields=[
+                ('isbn', models.CharField(max_length=13, primary_key=True, serialize=False)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('found', models.BooleanField(default=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
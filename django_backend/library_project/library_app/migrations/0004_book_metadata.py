@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0003_googlebookcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='description',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='metadata_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='published_date',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='publisher',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, default='', max_length=500),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0004_book_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-inserted_date', '-id'], name='book_inserted_date_idx'),
+        ),
+    ]
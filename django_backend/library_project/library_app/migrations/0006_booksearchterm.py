@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0005_book_inserted_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='library_app.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='booksearchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'book'), name='unique_search_term_per_book'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('library_app', 'Book')
+    Borrow = apps.get_model('library_app', 'Borrow')
+    Favorite = apps.get_model('library_app', 'Favorite')
+
+    def per_book(queryset, aggregate):
+        return Coalesce(
+            Subquery(
+                queryset.filter(book=OuterRef('pk')).order_by().values('book').annotate(value=aggregate).values('value'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Book.objects.update(
+        on_loan=per_book(Borrow.objects.filter(return_date__isnull=True), Sum('quantity_borrowed')),
+        total_borrows=per_book(Borrow.objects.all(), Count('id')),
+        favorite_count=per_book(Favorite.objects.all(), Count('id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0007_book_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='on_loan',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_borrows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:49
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_favorites(apps, schema_editor):
+    # Keep the oldest row of every (user, book) pair, then recount favorites
+    Book = apps.get_model('library_app', 'Book')
+    Favorite = apps.get_model('library_app', 'Favorite')
+    duplicates = (
+        Favorite.objects.values('user', 'book')
+        .annotate(keep=Min('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    books = set()
+    for duplicate in duplicates.iterator():
+        Favorite.objects.filter(user=duplicate['user'], book=duplicate['book']).exclude(id=duplicate['keep']).delete()
+        books.add(duplicate['book'])
+
+    favorites = Favorite.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(value=Count('id'))
+    Book.objects.filter(pk__in=books).update(
+        favorite_count=Coalesce(Subquery(favorites.values('value'), output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_book_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_favorite_per_user'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0009_unique_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
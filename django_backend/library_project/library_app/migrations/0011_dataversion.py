@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
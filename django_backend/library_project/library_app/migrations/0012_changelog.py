@@ -0,0 +1,50 @@
+# Generated by Django 4.2.5 on 2026-10-16 20:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def seed_changelog(apps, schema_editor):
+    # Log the rows that predate the change log, so a sync from token 0 sees everything
+    ChangeLogEntry = apps.get_model('library_app', 'ChangeLogEntry')
+    sources = [
+        (apps.get_model('library_app', 'Book').objects.values_list('id', flat=True), 'book', False),
+        (apps.get_model('library_app', 'Borrow').objects.values_list('id', 'user_id'), 'borrow', True),
+        (apps.get_model('library_app', 'Favorite').objects.values_list('book_id', 'user_id'), 'favorite', True),
+    ]
+    for rows, kind, per_user in sources:
+        batch = []
+        for row in rows.order_by('id').iterator(chunk_size=2000):
+            object_id, user_id = row if per_user else (row, None)
+            batch.append(ChangeLogEntry(kind=kind, object_id=object_id, user_id=user_id))
+            if len(batch) == 2000:
+                ChangeLogEntry.objects.bulk_create(batch)
+                batch = []
+        ChangeLogEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('book', 'Book'), ('borrow', 'Borrow'), ('favorite', 'Favorite')], max_length=8)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='changelog_user_id_idx')],
+            },
+        ),
+        migrations.RunPython(seed_changelog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2026-10-16 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0012_changelog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['user', '-borrowed_date', '-id'], name='borrow_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(
+                condition=models.Q(('return_date__isnull', True)),
+                fields=['book', 'user', 'borrowed_date', 'id'],
+                name='borrow_open_book_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-id'], name='favorite_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+# simplejwt's token_blacklist app leaves OutstandingToken.expires_at
+# unindexed; prune_tokens reads the expired rows off this index
+INDEX = models.Index(fields=['expires_at'], name='outstanding_expires_idx')
+
+
+def add_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('token_blacklist', 'OutstandingToken'), INDEX)
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('token_blacklist', 'OutstandingToken'), INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0013_borrow_favorite_indexes'),
+        ('token_blacklist', '0011_linearizes_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.5 on 2026-10-16 23:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('library_app', '0014_outstandingtoken_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('all', 'All time')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('favorites_added', models.PositiveIntegerField(default=0)),
+                ('favorites_removed', models.PositiveIntegerField(default=0)),
+                ('new_books', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('all', 'All time')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('favorites_added', models.PositiveIntegerField(default=0)),
+                ('favorites_removed', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library_app.book')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('all', 'All time')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='libraryactivity',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket'), name='unique_library_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookactivity',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'book'), name='unique_book_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='useractivity',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'bucket'), name='unique_user_activity'),
+        ),
+    ]
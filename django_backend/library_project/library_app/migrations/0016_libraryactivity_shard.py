@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0015_activity_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='libraryactivity',
+            name='unique_library_activity',
+        ),
+        migrations.AddField(
+            model_name='libraryactivity',
+            name='shard',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='libraryactivity',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'shard'), name='unique_library_activity_shard'),
+        ),
+    ]
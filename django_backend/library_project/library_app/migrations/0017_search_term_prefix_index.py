@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-16 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0016_libraryactivity_shard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booksearchterm',
+            index=models.Index(fields=['term'], name='search_term_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
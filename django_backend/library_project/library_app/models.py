@@ -6,6 +6,7 @@ from django.contrib.auth.hashers import make_password,check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.contrib.auth.hashers import make_password, check_password
 from django.db import models
+from django.utils import timezone
 
 # Custom User Manager
 class CustomUserManager(BaseUserManager):
@@ -36,6 +37,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     profile_image = models.ImageField(upload_to='Images/ProfilePics', null=True)
+    # Resized copies of profile_image; see api.images.generate_renditions
+    profile_image_renditions = models.JSONField(default=dict, blank=True)
     objects = CustomUserManager()
 
     def set_password(self, raw_password):
@@ -62,17 +65,57 @@ class Book(models.Model):
     author = models.CharField(max_length=255)
     isbn = models.CharField(max_length=13, unique=True)
     cover_image = models.ImageField(upload_to='Images/BooksCover')
+    # Resized copies of cover_image; see api.images.generate_renditions
+    cover_renditions = models.JSONField(default=dict, blank=True)
     inserted_date = models.DateTimeField(auto_now_add=True)
     quantity = models.PositiveIntegerField(default=0)
+    # Metadata enriched from Google Books, filled in ahead of time
+    publisher = models.CharField(max_length=255, blank=True, default='')
+    published_date = models.CharField(max_length=10, blank=True, default='')
+    description = models.TextField(blank=True, default='')
+    thumbnail_url = models.URLField(max_length=500, blank=True, default='')
+    metadata_updated_at = models.DateTimeField(null=True, blank=True)
+    # Counters maintained by the borrow/return/favorite views; see reconcile_book_counters
+    on_loan = models.PositiveIntegerField(default=0)
+    total_borrows = models.PositiveIntegerField(default=0)
+    favorite_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the catalog
+            models.Index(fields=['-inserted_date', '-id'], name='book_inserted_date_idx'),
+            # Sort keys offered by the book list and search endpoints
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+            models.Index(fields=['author', 'id'], name='book_author_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
 
+    def apply_book_info(self, book_info):
+        # Copy a normalized Google Books lookup onto the stored columns
+        self.title = self.title or book_info.get('title', '')[:255]
+        self.author = self.author or ', '.join(book_info.get('author', []))[:255]
+        self.publisher = book_info.get('publisher', '')[:255]
+        self.published_date = book_info.get('publishedDate', '')[:10]
+        self.description = book_info.get('description', '')
+        self.thumbnail_url = book_info.get('cover_image', '')[:500]
+        self.metadata_updated_at = timezone.now()
+
 # Favorite Model
 class Favorite(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_favorite_per_user'),
+        ]
+        indexes = [
+            # A user's favorites, newest first
+            models.Index(fields=['user', '-id'], name='favorite_user_id_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.book.title
     
@@ -83,7 +126,146 @@ class Borrow(models.Model):
     borrowed_date = models.DateField()
     return_date = models.DateField(null=True, blank=True)
     quantity_borrowed = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # A user's loans, newest first
+            models.Index(fields=['user', '-borrowed_date', '-id'], name='borrow_user_date_idx'),
+            # Open loans of a book, oldest first per user; closed loans stay out of the index
+            models.Index(
+                fields=['book', 'user', 'borrowed_date', 'id'],
+                condition=models.Q(return_date__isnull=True),
+                name='borrow_open_book_idx',
+            ),
+        ]
     
     def __str__(self) -> str:
         return self.book.title
 
+
+# Inverted index of folded words from Book title, author and ISBN
+class BookSearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'book'], name='unique_search_term_per_book'),
+        ]
+        indexes = [
+            # Prefix lookups (LIKE 'x%'); the operator class only applies on PostgreSQL,
+            # where the default index cannot serve LIKE under a locale collation
+            models.Index(fields=['term'], name='search_term_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self) -> str:
+        return self.term
+
+# Cached Google Books lookups, keyed by ISBN
+class GoogleBookCache(models.Model):
+    isbn = models.CharField(max_length=13, primary_key=True)
+    data = models.JSONField(null=True, blank=True)
+    found = models.BooleanField(default=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return self.isbn
+
+# Change token per data set (catalog, one user's loans, ...), behind ETag / Last-Modified
+class DataVersion(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    token = models.CharField(max_length=32)
+    updated_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return self.key
+
+# Append-only log of writes to books, loans and favorites, read by delta sync.
+# The id is the sync token; rows without a user are catalog changes every client sees.
+class ChangeLogEntry(models.Model):
+    BOOK = 'book'
+    BORROW = 'borrow'
+    FAVORITE = 'favorite'
+    KIND_CHOICES = [(BOOK, 'Book'), (BORROW, 'Borrow'), (FAVORITE, 'Favorite')]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    # Book and Borrow rows by primary key, favorites by book id (one per user and book)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # Not stored: whether a book change touched catalog fields, for the version keys it bumps
+    catalog = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changelog_user_id_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.kind} {self.object_id}'
+
+
+# Activity counters per hour, per day and in total (period 'all', one bucket
+# at the epoch), added to by the write paths; see api/stats.py
+class ActivityRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    ALL = 'all'
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day'), (ALL, 'All time')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    # Start of the hour or day, in UTC
+    bucket = models.DateTimeField()
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class LibraryActivity(ActivityRollup):
+    # Every write adds to these rows, so each bucket is split over STATS['SHARDS'] rows
+    shard = models.SmallIntegerField(default=0)
+    favorites_added = models.PositiveIntegerField(default=0)
+    favorites_removed = models.PositiveIntegerField(default=0)
+    new_books = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'shard'], name='unique_library_activity_shard'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.period} {self.bucket} shard {self.shard}'
+
+
+class BookActivity(ActivityRollup):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    favorites_added = models.PositiveIntegerField(default=0)
+    favorites_removed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index behind the top-N books of a window
+            models.UniqueConstraint(fields=['period', 'bucket', 'book'], name='unique_book_activity'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.period} {self.bucket} book {self.book_id}'
+
+
+class UserActivity(ActivityRollup):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            # Led by the user, for one user's series
+            models.UniqueConstraint(fields=['user', 'period', 'bucket'], name='unique_user_activity'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.period} {self.bucket} user {self.user_id}'
@@ -0,0 +1,91 @@
+import logging
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .api.images import generate_renditions, renditions_are_current
+from .api.search import index_books
+from .api.changes import changes_for, record
+from .api.stats import activity, count_activity
+from .api.object_cache import object_cache, user_key
+from .api.token_blacklist import blacklist_filter
+from .models import Book, CustomUser
+
+logger = logging.getLogger(__name__)
+
+
+# Keep the search index in step with every saved book; deletes cascade
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_books([instance])
+
+
+def refresh_renditions(instance, image_field, renditions_field):
+    # Render the sizes of a newly uploaded image, without re-sending post_save
+    field_file = getattr(instance, image_field)
+    if not field_file or renditions_are_current(field_file, getattr(instance, renditions_field)):
+        return
+    try:
+        renditions = generate_renditions(field_file)
+    except OSError:
+        logger.exception('Could not render %s', field_file.name)
+        return
+    setattr(instance, renditions_field, renditions)
+    type(instance).objects.filter(pk=instance.pk).update(**{renditions_field: renditions})
+
+
+@receiver(post_save, sender=Book)
+def render_cover(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_renditions(instance, 'cover_image', 'cover_renditions')
+
+
+@receiver(post_save, sender=CustomUser)
+def render_profile_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_renditions(instance, 'profile_image', 'profile_image_renditions')
+
+
+# Log every book written through the ORM (admin, shell, AddBookByISBN) for
+# delta sync and the catalog ETags
+@receiver(post_save, sender=Book)
+def log_saved_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record(*changes_for(instance))
+
+
+@receiver(post_delete, sender=Book)
+def log_deleted_book(sender, instance, **kwargs):
+    record(*changes_for(instance, deleted=True))
+
+
+# Count books added through the ORM in the statistics rollups
+@receiver(post_save, sender=Book)
+def count_new_book(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        count_activity(activity(new_books=1), at=instance.inserted_date)
+
+
+# Drop the user cached for CachedJWTAuthentication on every save or delete,
+# now and again on commit, so is_active, is_staff and password changes apply
+# to the next request
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    key = user_key(instance.pk)
+    object_cache.invalidate(key)
+    transaction.on_commit(partial(object_cache.invalidate, key))
+
+
+# Keep the blacklist prefilter of this worker current, and tell the others
+# to sync once the blacklisting is committed
+@receiver(post_save, sender=BlacklistedToken)
+def filter_blacklisted_token(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        blacklist_filter.add(instance.token.jti)
+        transaction.on_commit(blacklist_filter.publish)
@@ -1,6 +1,57 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib import admin
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from .models import Book, Favorite
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt import tokens as jwt_tokens
+from .middleware import MetricsMiddleware
+from .models import Book, BookActivity, Borrow, ChangeLogEntry, DataVersion, Favorite, GoogleBookCache, LibraryActivity
+from .api import authentication
+from .api.bulk_import import import_isbns
+from .api.google_books import (
+    AsyncGoogleBooksClient,
+    BookInfoCache,
+    CircuitBreaker,
+    CircuitOpenError,
+    GoogleBooksClient,
+    GoogleBooksError,
+    SingleFlight,
+    fetch_book_infos,
+    lookup_many,
+)
+from .api.live import RESYNC, LocalBroker, get_broker
+from .api.metrics import registry
+from .api.object_cache import object_cache, user_key
+from .api.renderers import FastJSONRenderer
+from .api.search import search_books
+from .api.serializers import BOOK_COLUMNS, BookRows, BookSerializer, BorrowedBookSerializer
+from .api.views import availability_stream
+from .api.sorting import sort_books
+from .api.token_blacklist import BlacklistFilter, BloomFilter, blacklist_filter
+from .loadtest import StubGoogleBooksServer, compare, run
 
 User = get_user_model()
 
@@ -74,3 +125,1655 @@ class FavoriteModelTest(TestCase):
         # Check favorite associations
         self.assertEqual(favorite.user, self.user)
         self.assertEqual(favorite.book, self.book)
+
+
+# Test case for the Google Books metadata cache
+class BookInfoCacheTest(TestCase):
+    volumes = {
+        '9780140449266': {
+            'title': 'The Art of War',
+            'authors': ['Sun Tzu'],
+            'publisher': 'Penguin',
+            'imageLinks': {'thumbnail': 'http://covers/art-of-war.jpg'},
+        },
+    }
+
+    def setUp(self):
+        self.server = StubGoogleBooksServer(self.volumes).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_BOOKS={'API_URL': self.server.url, 'LRU_SIZE': 2})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = BookInfoCache(background=False)
+
+    def test_warm_lookups_never_hit_the_network(self):
+        for _ in range(10):
+            info = self.cache.get('9780140449266')
+        self.assertEqual(info['title'], 'The Art of War')
+        self.assertEqual(info['author'], ['Sun Tzu'])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.cache.stats['memory_hits'], 9)
+
+    def test_persistent_tier_survives_process_restart(self):
+        self.cache.get('9780140449266')
+        fresh_cache = BookInfoCache(background=False)
+        info = fresh_cache.get('9780140449266')
+        self.assertEqual(info['publisher'], 'Penguin')
+        self.assertEqual(fresh_cache.stats['db_hits'], 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unknown_isbn_is_negatively_cached(self):
+        self.assertIsNone(self.cache.get('0000000000000'))
+        self.assertIsNone(self.cache.get('0000000000000'))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(GoogleBookCache.objects.get(isbn='0000000000000').found)
+
+    def test_lru_is_bounded(self):
+        for isbn in ('1111111111111', '2222222222222', '3333333333333'):
+            self.cache.get(isbn)
+        self.assertEqual(len(self.cache._entries), 2)
+        self.assertNotIn('1111111111111', self.cache._entries)
+
+    def test_stale_entry_is_served_then_revalidated(self):
+        GoogleBookCache.objects.create(
+            isbn='9780140449266',
+            data={'title': 'Old title'},
+            fetched_at=timezone.now() - timedelta(days=8),
+        )
+        self.assertEqual(self.cache.get('9780140449266')['title'], 'Old title')
+        self.assertEqual(self.cache.stats['stale'], 1)
+        self.assertEqual(self.cache.get('9780140449266')['title'], 'The Art of War')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_malformed_isbn_is_neither_fetched_nor_cached(self):
+        self.assertIsNone(self.cache.get('978-0-14-044926-6'))
+        self.assertIsNone(self.cache.get(None))
+        self.assertEqual(self.server.requests, [])
+        self.assertFalse(GoogleBookCache.objects.exists())
+
+
+# Test cases for adding a book by ISBN
+class AddBookByISBNTest(TestCase):
+    def setUp(self):
+        self.server = StubGoogleBooksServer({'9780140449266': {'title': 'The Art of War'}}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_BOOKS={'API_URL': self.server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123', first_name='Jane', last_name='Doe',
+        ))
+
+    def test_hyphenated_isbn_is_normalized(self):
+        response = self.client.post('/books/add/', {'isbn': '978-0-14-044926-6'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Book.objects.get().isbn, '9780140449266')
+        self.assertFalse(GoogleBookCache.objects.filter(isbn__contains='-').exists())
+
+    def test_missing_or_malformed_isbn_is_rejected_before_any_lookup(self):
+        for data in ({}, {'isbn': '978-0-14-044926-6-1234'}, {'isbn': 12}):
+            self.assertEqual(self.client.post('/books/add/', data, format='json').status_code, 400)
+        self.assertEqual(self.server.requests, [])
+        self.assertFalse(GoogleBookCache.objects.exists())
+
+
+# Test cases for the pooled Google Books client
+class GoogleBooksClientTest(TestCase):
+    volumes = {
+        '9780140449266': {'title': 'The Art of War'},
+        '9780670881468': {'title': 'The 48 Laws of Power'},
+    }
+
+    def setUp(self):
+        self.server = StubGoogleBooksServer(self.volumes, failing={'9999999999999'}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_BOOKS={
+            'API_URL': self.server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_batch_lookup_is_one_request(self):
+        client = GoogleBooksClient()
+        results = client.fetch_many(['9780140449266', '9780670881468'])
+        self.assertEqual(results['9780140449266']['title'], 'The Art of War')
+        self.assertEqual(results['9780670881468']['title'], 'The 48 Laws of Power')
+        self.assertEqual(self.server.requests, ['isbn:9780140449266 OR isbn:9780670881468'])
+
+    def test_unmatched_batch_isbns_are_asked_for_singly(self):
+        results = fetch_book_infos(['9780140449266', '0000000000000'])
+        self.assertIsNone(results['0000000000000'])
+        self.assertEqual(self.server.requests[1:], ['isbn:0000000000000'])
+
+    def test_breaker_opens_then_lets_a_trial_through(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=2, reset_after=30, clock=lambda: now[0])
+        client = GoogleBooksClient(breaker)
+        for _ in range(2):
+            with self.assertRaises(GoogleBooksError):
+                client.fetch('9999999999999')
+        with self.assertRaises(CircuitOpenError):
+            client.fetch('9780140449266')
+        self.assertEqual(len(self.server.requests), 2)
+
+        now[0] = 31
+        self.assertEqual(client.fetch('9780140449266')['title'], 'The Art of War')
+        self.assertTrue(breaker.allow())
+
+    def test_breaker_trial_settles_on_any_exception(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=1, reset_after=30, clock=lambda: now[0])
+
+        def fail(error):
+            raise error
+
+        with self.assertRaises(GoogleBooksError):
+            breaker.call(fail, GoogleBooksError('down'))
+        now[0] = 31
+        with self.assertRaises(RuntimeError):
+            breaker.call(fail, RuntimeError('bug'))
+        # The failed trial reopened the circuit instead of holding it half-open
+        self.assertFalse(breaker.allow())
+        now[0] = 62
+        self.assertEqual(breaker.call(lambda: 'info'), 'info')
+        self.assertTrue(breaker.allow())
+
+    def test_lookup_many_fetches_in_batches_and_caches(self):
+        results, errors = lookup_many(['9780140449266', '9780670881468'])
+        self.assertEqual(errors, {})
+        self.assertEqual(results['9780670881468']['title'], 'The 48 Laws of Power')
+        self.assertEqual(self.server.requests, ['isbn:9780140449266 OR isbn:9780670881468'])
+        self.assertEqual(GoogleBookCache.objects.filter(found=True).count(), 2)
+
+        # A failing batch is retried ISBN by ISBN, so only the bad ISBN fails
+        results, errors = lookup_many(['9780140449266', '0000000000000', '9999999999999'])
+        self.assertEqual(results['9780140449266']['title'], 'The Art of War')
+        self.assertIsNone(results['0000000000000'])
+        self.assertEqual(list(errors), ['9999999999999'])
+
+    def test_lookup_many_failures_trip_the_shared_breaker(self):
+        books_client = GoogleBooksClient(CircuitBreaker(threshold=2, reset_after=60))
+        for _ in range(2):
+            results, errors = lookup_many(['9999999999999'], books_client=books_client)
+            self.assertIsInstance(errors['9999999999999'], GoogleBooksError)
+        self.assertFalse(books_client.breaker.allow())
+
+        requests_before = len(self.server.requests)
+        results, errors = lookup_many(['9780140449266'], books_client=books_client)
+        self.assertIsInstance(errors['9780140449266'], CircuitOpenError)
+        self.assertEqual(len(self.server.requests), requests_before)
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'info'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('isbn', slow)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flights.do('isbn', slow)))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(results, ['info', 'info'])
+        self.assertEqual(len(calls), 1)
+
+    def test_async_lookups_of_one_isbn_are_coalesced(self):
+        client = AsyncGoogleBooksClient(GoogleBooksClient())
+
+        async def lookup():
+            try:
+                return await asyncio.gather(*(client.fetch('9780140449266') for _ in range(5)))
+            finally:
+                await client.aclose()
+
+        results = async_to_sync(lookup)()
+        self.assertEqual({info['title'] for info in results}, {'The Art of War'})
+        self.assertEqual(self.server.requests, ['isbn:9780140449266'])
+
+
+# Test case for the book catalog endpoint
+class BookListTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        book = Book(isbn='9780140449266', quantity=3)
+        book.apply_book_info({
+            'title': 'The Art of War',
+            'author': ['Sun Tzu'],
+            'publisher': 'Penguin',
+            'publishedDate': '2009-04-01',
+            'description': 'Strategy.',
+            'cover_image': 'http://covers/art-of-war.jpg',
+        })
+        book.save()
+
+    def test_list_reads_stored_metadata_without_network(self):
+        with mock.patch('library_app.api.google_books.requests.get') as get:
+            # ETag validators, the page's sort keys, then the uncached rows
+            with self.assertNumQueries(3):
+                response = self.client.get('/books/')
+        get.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        row = response.data['results'][0]
+        self.assertEqual(row['title'], 'The Art of War')
+        self.assertEqual(row['author'], 'Sun Tzu')
+        self.assertEqual(row['publisher'], 'Penguin')
+        self.assertEqual(row['published_date'], '2009-04-01')
+        self.assertEqual(row['thumbnail_url'], 'http://covers/art-of-war.jpg')
+
+
+# Test case for the enrich_books management command
+class EnrichBooksCommandTest(TestCase):
+    def setUp(self):
+        self.server = StubGoogleBooksServer(
+            {'9780140449266': {'title': 'The Art of War', 'publisher': 'Penguin'}},
+            failing={'9999999999999'},
+        ).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_BOOKS={
+            'API_URL': self.server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.found = Book.objects.create(title='Art of War', author='Sun Tzu', isbn='9780140449266')
+        self.missing = Book.objects.create(title='Unknown', author='Nobody', isbn='0000000000000')
+        self.failing = Book.objects.create(title='Broken', author='Nobody', isbn='9999999999999')
+
+    def enrich(self, *args):
+        out = io.StringIO()
+        call_command('enrich_books', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_enriches_missing_metadata_and_reports_errors(self):
+        output = self.enrich('--workers', '4')
+        self.found.refresh_from_db()
+        self.missing.refresh_from_db()
+        self.failing.refresh_from_db()
+        self.assertEqual(self.found.publisher, 'Penguin')
+        self.assertIsNotNone(self.missing.metadata_updated_at)
+        self.assertIsNone(self.failing.metadata_updated_at)
+        self.assertIn('1 enriched, 1 not found, 1 errors', output)
+
+        # A second run only retries the book that errored
+        self.server.requests.clear()
+        self.enrich()
+        self.assertEqual(self.server.requests, ['isbn:9999999999999'])
+
+    def test_resumes_after_cursor(self):
+        self.enrich('--after-id', str(self.found.id))
+        self.found.refresh_from_db()
+        self.missing.refresh_from_db()
+        self.assertIsNone(self.found.metadata_updated_at)
+        self.assertIsNotNone(self.missing.metadata_updated_at)
+
+
+# Test cases for the bulk ISBN import endpoint and command
+class BulkImportTest(TestCase):
+    def setUp(self):
+        self.server = StubGoogleBooksServer({
+            '9780140449266': {'title': 'The Art of War', 'authors': ['Sun Tzu']},
+            '9780670881468': {'title': 'The 48 Laws of Power', 'authors': ['Robert Greene', 'Joost Elffers']},
+        }).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_BOOKS={
+            'API_URL': self.server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007')
+        self.admin = User.objects.create_superuser(user_name='admin', email='admin@example.com', password='admin123')
+
+    def test_endpoint_streams_per_isbn_report(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/books/import/', {
+            'isbns': ['978-0-14-044926-6', '9789994400007', '0000000000000', '9780140449266', 'not-an-isbn'],
+            'quantity': 2,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        report = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        statuses = {(row['isbn'], row['status']) for row in report}
+        self.assertEqual(statuses, {
+            ('9780140449266', 'created'),
+            ('9789994400007', 'exists'),
+            ('0000000000000', 'not_found'),
+            ('9780140449266', 'duplicate'),
+            ('NOTANISBN', 'invalid'),
+        })
+        book = Book.objects.get(isbn='9780140449266')
+        self.assertEqual((book.title, book.author, book.quantity), ('The Art of War', 'Sun Tzu', 2))
+
+    def test_isbn_created_by_a_racing_import_does_not_break_the_stream(self):
+        def lookup_and_race(isbns, **kwargs):
+            # Another import commits one of the ISBNs between the check and the insert
+            Book.objects.bulk_create([Book(title='The Art of War', isbn='9780140449266')])
+            return lookup_many(isbns, **kwargs)
+
+        with mock.patch('library_app.api.bulk_import.lookup_many', lookup_and_race):
+            report = list(import_isbns(['9780140449266', '9780670881468']))
+        self.assertEqual(
+            {(row['isbn'], row['status']) for row in report},
+            {('9780140449266', 'exists'), ('9780670881468', 'created')},
+        )
+        self.assertEqual(Book.objects.filter(isbn__in=['9780140449266', '9780670881468']).count(), 2)
+        self.assertTrue(search_books('laws').exists())
+        # Oromay from setUp and the one book this import created
+        all_time = LibraryActivity.objects.filter(period=LibraryActivity.ALL)
+        self.assertEqual(all_time.aggregate(total=Sum('new_books'))['total'], 2)
+
+    def test_negative_quantity_is_rejected_before_any_insert(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/books/import/', {'isbns': ['9780140449266'], 'quantity': -1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(CommandError):
+            call_command('import_isbns', '-', '--quantity', '-1', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(Book.objects.filter(isbn='9780140449266').exists())
+
+    def test_endpoint_requires_admin(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123', first_name='Jane', last_name='Doe',
+        ))
+        response = client.post('/books/import/', {'isbns': ['9780140449266']}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_reads_csv_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('isbn,quantity\n9780140449266,4\n9780670881468,1\n9789994400007,3\n')
+        self.addCleanup(os.remove, csv_file.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_isbns', csv_file.name, '--batch-size', '2', stdout=out, stderr=err)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        self.assertIn('2 created, 1 exists', err.getvalue())
+        self.assertEqual(Book.objects.get(isbn='9780140449266').quantity, 4)
+        self.assertEqual(Book.objects.get(isbn='9780670881468').author, 'Robert Greene, Joost Elffers')
+
+
+# Test cases for the bulk user import endpoint and command
+class BulkUserImportTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(user_name='admin', email='admin@example.com', password='admin123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def row(self, user_name, **fields):
+        return {
+            'user_name': user_name, 'email': f'{user_name}@example.com', 'first_name': 'Jane', 'last_name': 'Doe',
+            'password': f'{user_name}-secret', **fields,
+        }
+
+    def test_endpoint_streams_per_row_report(self):
+        response = self.client.post('/users/import/', {'users': [
+            self.row('alice'),
+            self.row('admin'),
+            self.row('alice'),
+            self.row('bob', email='not-an-email'),
+            self.row('carol', password=''),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        report = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [(row['row'], row['status']) for row in report],
+            [(1, 'created'), (2, 'exists'), (3, 'duplicate'), (4, 'invalid'), (5, 'invalid')],
+        )
+        self.assertEqual(set(report[3]['errors']), {'email'})
+        self.assertNotIn('secret', json.dumps(report))
+        self.assertTrue(User.objects.get(user_name='alice').check_password('alice-secret'))
+
+    def test_endpoint_requires_admin(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123', first_name='Jane', last_name='Doe',
+        ))
+        response = client.post('/users/import/', {'users': [self.row('alice')]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_hashes_across_processes_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('user_name,email,first_name,last_name,password\n')
+            for number in range(5):
+                csv_file.write(f'user{number},user{number}@example.com,Jane,Doe,secret-{number}\n')
+        self.addCleanup(os.remove, csv_file.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_users', csv_file.name, '--batch-size', '2', '--workers', '2', stdout=out, stderr=err)
+        self.assertIn('Imported 5 rows: 5 created', err.getvalue())
+        self.assertIn('users/s with 2 workers on', err.getvalue())
+        self.assertTrue(User.objects.get(user_name='user4').check_password('secret-4'))
+
+
+# Test cases for the user listing and export
+class UserListTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(user_name='admin', email='admin@example.com', password='admin123')
+        for number in range(5):
+            User.objects.create_user(
+                user_name=f'reader{number}', email=f'reader{number}@example.com', password='password123',
+                first_name='Jane', last_name='Doe',
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list_prefetches_relations_and_hides_passwords(self):
+        # The page, then one query each for groups and permissions
+        with self.assertNumQueries(3):
+            response = self.client.get('/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertNotIn('password', response.data['results'][0])
+        self.assertEqual(response.data['results'][1]['groups'], [])
+
+    def test_export_streams_csv(self):
+        response = self.client.get('/users/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_name', 'email'])
+        self.assertEqual(len(lines), 7)
+        self.assertNotIn('pbkdf2', '\n'.join(lines))
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get('/users/export/?output=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['user_name'] for row in rows], ['admin'] + [f'reader{number}' for number in range(5)])
+        self.assertNotIn('password', rows[0])
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(User.objects.get(user_name='reader0'))
+        self.assertEqual(self.client.get('/users/export/').status_code, 403)
+
+
+# Test case for keyset pagination on the list endpoints
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Book.objects.bulk_create([
+            Book(title=f'Book {number}', author='Author', isbn=f'{number:013d}', quantity=1)
+            for number in range(5)
+        ])
+
+    def test_walks_all_pages_without_gaps_or_duplicates(self):
+        seen = []
+        url = '/books/?page_size=2'
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            seen.extend(row['isbn'] for row in response.data['results'])
+            if not response.data['has_more']:
+                self.assertIsNone(response.data['next_cursor'])
+                break
+            url = f"/books/?page_size=2&cursor={response.data['next_cursor']}"
+        self.assertEqual(sorted(seen), [f'{number:013d}' for number in range(5)])
+        self.assertEqual(len(seen), 5)
+
+    def test_favorites_use_the_same_envelope(self):
+        for book in Book.objects.all()[:3]:
+            Favorite.objects.create(user=self.user, book=book)
+        response = self.client.get('/favorited-books/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['has_more'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/books/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_benchmark_command_runs(self):
+        out = io.StringIO()
+        call_command('benchmark', 'pagination', '--sizes', '50,100', '--repeat', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        self.assertEqual(Book.objects.count(), 5)
+
+
+# Test cases for the book search index
+class SearchBookTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.war = Book.objects.create(title='The Art of War', author='Sun Tzu', isbn='9780140449266')
+        self.power = Book.objects.create(title='The 48 Laws of Power', author='Robert Greene', isbn='9780670881468')
+        self.misérables = Book.objects.create(title='Les Misérables', author='Victor Hugo', isbn='9782253096344')
+        self.oromay = Book.objects.create(title='ኦሮማይ', author='በዓሉ ግርማ', isbn='9789994400007')
+
+    def search(self, query):
+        response = self.client.get('/search/', {'query': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_prefix_matching_for_type_ahead(self):
+        self.assertEqual(self.search('the art of w'), ['The Art of War'])
+        self.assertEqual(self.search('gree'), ['The 48 Laws of Power'])
+
+    def test_accent_and_case_folding(self):
+        self.assertEqual(self.search('MISERABLES'), ['Les Misérables'])
+        self.assertEqual(self.search('ኦሮማ'), ['ኦሮማይ'])
+
+    def test_prefix_matching_beyond_ascii(self):
+        Book.objects.create(title='Ελληνικά snake_case', author='Ωmega', isbn='9781111111111')
+        Book.objects.create(title='Ελλάδα snakeXcase', author='Omega', isbn='9782222222222')
+        self.assertEqual(sorted(self.search('ελλ')), ['Ελλάδα snakeXcase', 'Ελληνικά snake_case'])
+        self.assertEqual(self.search('ελλη'), ['Ελληνικά snake_case'])
+        self.assertEqual(self.search('ωm'), ['Ελληνικά snake_case'])
+        # LIKE wildcards in the typed prefix match literally
+        self.assertEqual(self.search('snake_'), ['Ελληνικά snake_case'])
+
+    def test_results_are_ranked_by_relevance(self):
+        Book.objects.create(title='Power Moves', author='Greene Power', isbn='9781111111111')
+        self.assertEqual(self.search('power'), ['Power Moves', 'The 48 Laws of Power'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.war.title = 'Strategy'
+        self.war.save()
+        self.assertEqual(self.search('war'), [])
+        self.assertEqual(self.search('strategy'), ['Strategy'])
+        self.power.delete()
+        self.assertEqual(self.search('laws'), [])
+
+    def test_search_results_are_paged(self):
+        titles = []
+        response = self.client.get('/search/', {'query': 'the', 'page_size': 1})
+        titles.append(response.data['results'][0]['title'])
+        response = self.client.get('/search/', {'query': 'the', 'page_size': 1, 'cursor': response.data['next_cursor']})
+        titles.append(response.data['results'][0]['title'])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(sorted(titles), ['The 48 Laws of Power', 'The Art of War'])
+
+
+# Test cases for the sort parameter of the book list and search endpoints
+class BookSortTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007')
+        Book.objects.create(title='The Art of War', author='Sun Tzu', isbn='9780140449266')
+        Book.objects.create(title='Your Next Five Moves', author='Patrick Bet-David', isbn='9781982154806')
+
+    def titles(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_books_sorted_by_the_database(self):
+        self.assertEqual(
+            self.titles('/books/', {'sort': 'title'}),
+            ['Oromay', 'The Art of War', 'Your Next Five Moves'],
+        )
+        self.assertEqual(
+            self.titles('/books/', {'sort': 'author', 'order': 'desc'}),
+            ['The Art of War', 'Your Next Five Moves', 'Oromay'],
+        )
+
+    def test_sorted_pages_follow_the_cursor(self):
+        response = self.client.get('/books/', {'sort': 'isbn', 'page_size': 2})
+        cursor = response.data['next_cursor']
+        self.assertEqual(self.titles('/books/', {'sort': 'isbn', 'page_size': 2, 'cursor': cursor}), ['Oromay'])
+
+    def test_search_results_can_be_sorted(self):
+        self.assertEqual(
+            self.titles('/search/', {'query': '978', 'sort': 'title', 'order': 'desc'}),
+            ['Your Next Five Moves', 'The Art of War', 'Oromay'],
+        )
+
+    def test_unknown_sort_is_rejected(self):
+        response = self.client.get('/books/', {'sort': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_in_memory_sort_is_stable(self):
+        books = [Book(title='B', isbn='2'), Book(title='A', isbn='3'), Book(title='B', isbn='1')]
+        self.assertEqual([book.isbn for book in sort_books(books, 'title')], ['3', '2', '1'])
+        self.assertEqual([book.isbn for book in sort_books(books, 'title', descending=True)], ['2', '1', '3'])
+
+
+# Test cases for borrowing under concurrent requests
+class BorrowBookTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=1)
+
+    def test_borrow_decrements_stock_and_records_loan(self):
+        response = self.client.post(f'/borrow/{self.book.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 0)
+        self.assertEqual(Borrow.objects.filter(user=self.user, book=self.book).count(), 1)
+
+        response = self.client.post(f'/borrow/{self.book.id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Borrow.objects.count(), 1)
+
+    def test_unknown_book(self):
+        response = self.client.post('/borrow/999/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ConcurrentBorrowTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('in-memory SQLite locks whole tables against concurrent writers')
+
+    def test_stock_never_goes_negative(self):
+        users = [
+            User.objects.create_user(
+                user_name=f'reader{number}', email=f'reader{number}@example.com', password='password123',
+                first_name='Jane', last_name='Doe',
+            )
+            for number in range(20)
+        ]
+        book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=5)
+        statuses = []
+
+        def borrow(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                statuses.append(client.post(f'/borrow/{book.id}/').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        book.refresh_from_db()
+        self.assertEqual(book.quantity, 0)
+        self.assertEqual(statuses.count(200), 5)
+        self.assertEqual(statuses.count(400), 15)
+        self.assertEqual(Borrow.objects.filter(book=book).count(), 5)
+
+
+# Test cases for returning books and the availability counters
+class ReturnBookTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=2)
+
+    def test_counters_follow_borrow_return_and_favorite(self):
+        self.client.post(f'/borrow/{self.book.id}/')
+        self.client.post(f'/favorite/{self.book.id}/')
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.quantity, self.book.on_loan, self.book.total_borrows, self.book.favorite_count),
+            (1, 1, 1, 1),
+        )
+
+        response = self.client.post(f'/return/{self.book.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.client.post(f'/favorite/{self.book.id}/')
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.quantity, self.book.on_loan, self.book.total_borrows, self.book.favorite_count),
+            (2, 0, 1, 0),
+        )
+        self.assertIsNotNone(Borrow.objects.get().return_date)
+
+    def test_return_without_open_loan(self):
+        response = self.client.post(f'/return/{self.book.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_return_racing_another_takes_the_next_open_loan(self):
+        self.client.post(f'/borrow/{self.book.id}/')
+        self.client.post(f'/borrow/{self.book.id}/')
+        first = Borrow.objects.order_by('id').first()
+
+        def concurrent_return(execute, sql, params, many, context):
+            # Another request closes the oldest loan just before this one's UPDATE
+            if sql.startswith('UPDATE') and 'library_app_borrow' in sql and not concurrent_return.done:
+                concurrent_return.done = True
+                Borrow.objects.filter(pk=first.pk).update(return_date=timezone.now().date())
+            return execute(sql, params, many, context)
+        concurrent_return.done = False
+
+        with connection.execute_wrapper(concurrent_return):
+            response = self.client.post(f'/return/{self.book.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Borrow.objects.filter(return_date__isnull=True).exists())
+
+    def test_return_with_drifted_counter_does_not_fail(self):
+        self.client.post(f'/borrow/{self.book.id}/')
+        Book.objects.filter(pk=self.book.id).update(on_loan=0)
+        response = self.client.post(f'/return/{self.book.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.quantity, self.book.on_loan), (2, 0))
+
+    def test_admin_writes_recount_the_book(self):
+        request = mock.Mock(user=User.objects.create_superuser(
+            user_name='admin', email='admin@example.com', password='admin123',
+        ))
+        self.client.post(f'/borrow/{self.book.id}/')
+        self.client.post(f'/favorite/{self.book.id}/')
+        admin.site._registry[Borrow].delete_queryset(request, Borrow.objects.all())
+        admin.site._registry[Favorite].delete_model(request, Favorite.objects.get())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.on_loan, self.book.total_borrows, self.book.favorite_count), (0, 0, 0))
+
+        borrow = Borrow(user=self.user, book=self.book, borrowed_date=timezone.now().date())
+        admin.site._registry[Borrow].save_model(request, borrow, None, False)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.on_loan, self.book.total_borrows), (1, 1))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Borrow.objects.create(user=self.user, book=self.book, borrowed_date=timezone.now().date())
+        Favorite.objects.create(user=self.user, book=self.book)
+        out = io.StringIO()
+        call_command('reconcile_book_counters', '--dry-run', stdout=out)
+        self.assertIn('9789994400007: on_loan 0 -> 1, total_borrows 0 -> 1, favorite_count 0 -> 1', out.getvalue())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.on_loan, 0)
+
+        call_command('reconcile_book_counters', stdout=io.StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.on_loan, self.book.total_borrows, self.book.favorite_count), (1, 1, 1))
+
+
+# Test cases for toggling and syncing favorites
+class FavoriteToggleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = [
+            Book.objects.create(title=f'Book {number}', author='Author', isbn=f'{number:013d}')
+            for number in range(3)
+        ]
+
+    def statements(self, queries):
+        return [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+
+    def test_toggle_uses_few_queries(self):
+        book = self.books[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/favorite/{book.id}/')
+        self.assertEqual(response.status_code, 201)
+        # Then the change log entries, the list version bump and the library
+        # and book statistics upserts; a favorite has no per-user statistics
+        self.assertEqual(
+            self.statements(queries), ['DELETE', 'INSERT', 'UPDATE', 'INSERT', 'INSERT', 'INSERT', 'INSERT'],
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/favorite/{book.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statements(queries), ['DELETE', 'UPDATE', 'INSERT', 'INSERT', 'INSERT', 'INSERT'])
+        book.refresh_from_db()
+        self.assertEqual(book.favorite_count, 0)
+
+    def test_unfavorite_with_drifted_counter_does_not_fail(self):
+        for book in self.books[:2]:
+            self.client.post(f'/favorite/{book.id}/')
+        Book.objects.update(favorite_count=0)
+        self.assertEqual(self.client.post(f'/favorite/{self.books[0].id}/').status_code, 200)
+        response = self.client.post('/favorites/sync/', {'remove': [self.books[1].id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(Book.objects.values_list('favorite_count', flat=True)), {0})
+
+    def test_toggle_unknown_book(self):
+        response = self.client.post('/favorite/999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_toggle_unknown_book_with_immediate_foreign_key_checks(self):
+        with mock.patch.object(Favorite.objects, 'create', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            response = self.client.post('/favorite/999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_duplicate_rows_are_rejected(self):
+        Favorite.objects.create(user=self.user, book=self.books[0])
+        with self.assertRaises(IntegrityError):
+            Favorite.objects.create(user=self.user, book=self.books[0])
+
+    def test_sync_applies_batch(self):
+        self.client.post(f'/favorite/{self.books[0].id}/')
+        response = self.client.post('/favorites/sync/', {
+            'add': [self.books[1].id, self.books[2].id, 999],
+            'remove': [self.books[0].id, 998],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], [self.books[1].id, self.books[2].id])
+        self.assertEqual(response.data['removed'], [self.books[0].id])
+        self.assertEqual(response.data['not_found'], [999])
+        self.assertEqual(
+            set(Favorite.objects.filter(user=self.user).values_list('book_id', flat=True)),
+            {self.books[1].id, self.books[2].id},
+        )
+        self.assertEqual(Book.objects.get(pk=self.books[2].id).favorite_count, 1)
+
+
+# Test cases for the cover image renditions
+class CoverRenditionTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+
+    def cover(self, name='cover.jpg'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 1200), 'navy').save(buffer, format='JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_renders_every_size_and_format(self):
+        book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', cover_image=self.cover())
+        renditions = Book.objects.get(pk=book.pk).cover_renditions
+        self.assertEqual(renditions['original'], book.cover_image.name)
+        with default_storage.open(renditions['small']['webp']) as small:
+            self.assertEqual(max(Image.open(small).size), 128)
+        with default_storage.open(renditions['large']['jpeg']) as large:
+            self.assertEqual(Image.open(large).size, (427, 640))
+
+        Favorite.objects.create(user=self.user, book=book)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        row = client.get('/favorited-books/').data['results'][0]['book']
+        self.assertEqual(set(row['cover_images']), {'small', 'medium', 'large'})
+        self.assertTrue(row['cover_images']['medium']['webp'].endswith('.medium.webp'))
+        self.assertEqual(client.get('/books/').data['results'][0]['cover_images'], row['cover_images'])
+
+    def test_backfill_command(self):
+        book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', cover_image=self.cover())
+        Book.objects.filter(pk=book.pk).update(cover_renditions={})
+        out = io.StringIO()
+        call_command('generate_renditions', stdout=out)
+        self.assertIn('Book: 1 rendered, 0 already current', out.getvalue())
+        self.assertTrue(Book.objects.get(pk=book.pk).cover_renditions)
+        call_command('generate_renditions', stdout=out)
+        self.assertIn('Book: 0 rendered, 1 already current', out.getvalue())
+
+
+# Test cases for conditional GET on the list endpoints
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.other = User.objects.create_user(
+            user_name='other', email='other@example.com', password='password123',
+            first_name='John', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=3)
+
+    def test_unchanged_catalog_answers_304_without_listing(self):
+        first = self.client.get('/books/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        # The page's sort keys, then the ETag validators
+        with self.assertNumQueries(2):
+            second = self.client.get('/books/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+
+        self.client.post(f'/borrow/{self.book.id}/')
+        third = self.client.get('/books/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_loans_only_change_the_pages_showing_the_book(self):
+        other_book = Book.objects.create(title='Fikir Eske Mekabir', author='Haddis Alemayehu', isbn='9789994400014', quantity=3)
+        catalog = DataVersion.objects.get(key='books').token
+        # The newest book alone
+        first = self.client.get('/books/?page_size=1')
+        self.client.post(f'/borrow/{self.book.id}/')
+        self.client.post(f'/favorite/{self.book.id}/')
+        self.assertEqual(self.client.get('/books/?page_size=1', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(DataVersion.objects.get(key='books').token, catalog)
+
+        self.client.post(f'/borrow/{other_book.id}/')
+        response = self.client.get('/books/?page_size=1', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['quantity'], 2)
+
+    def test_each_page_has_its_own_etag(self):
+        self.assertNotEqual(
+            self.client.get('/books/')['ETag'],
+            self.client.get('/books/?page_size=1')['ETag'],
+        )
+
+    def test_per_user_lists_validate_per_user(self):
+        other_client = APIClient()
+        other_client.force_authenticate(self.other)
+        mine = self.client.get('/favorited-books/')['ETag']
+        self.assertNotEqual(other_client.get('/favorited-books/')['ETag'], mine)
+
+        self.client.post(f'/favorite/{self.book.id}/')
+        response = self.client.get('/favorited-books/', HTTP_IF_NONE_MATCH=mine)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+# Test cases for delta sync
+# Ids rolled back by earlier tests leave gaps on PostgreSQL, so gaps settle at once here
+@override_settings(SYNC={'GAP_TIMEOUT': 0})
+class SyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.other = User.objects.create_user(
+            user_name='other', email='other@example.com', password='password123',
+            first_name='John', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+        self.books = [
+            Book.objects.create(title=f'Book {number}', author='Author', isbn=f'{number:013d}', quantity=2)
+            for number in range(3)
+        ]
+
+    def sync(self, token='0', **params):
+        response = self.client.get('/sync/', {'since': token, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_sync_from_zero(self):
+        data = self.sync()
+        self.assertEqual({book['isbn'] for book in data['books']}, {book.isbn for book in self.books})
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['deleted_books'], [])
+
+    def test_only_changes_after_token_are_sent(self):
+        token = self.sync()['token']
+        book = self.books[1]
+        self.client.post(f'/borrow/{book.id}/')
+        self.client.post(f'/favorite/{book.id}/')
+        self.other_client.post(f'/favorite/{self.books[2].id}/')
+
+        data = self.sync(token)
+        # The other user's favorite changed book 2's counter, but not this user's favorites
+        self.assertEqual(sorted(row['id'] for row in data['books']), [book.id, self.books[2].id])
+        self.assertEqual(data['favorites'], [book.id])
+        self.assertEqual([(row['book'], row['return_date']) for row in data['borrows']], [(book.id, None)])
+        self.assertEqual(self.sync(data['token'])['books'], [])
+
+    def test_deletes_come_back_as_tombstones(self):
+        book = self.books[0]
+        self.client.post(f'/favorite/{book.id}/')
+        token = self.sync()['token']
+        self.client.post(f'/favorite/{book.id}/')
+        removed_id = self.books[2].id
+        self.books[2].delete()
+
+        data = self.sync(token)
+        self.assertEqual(data['favorites'], [])
+        self.assertEqual(data['deleted_favorites'], [book.id])
+        self.assertEqual(data['deleted_books'], [removed_id])
+
+    def test_sync_pages_with_limit(self):
+        data = self.sync(limit=2)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['books']), 2)
+        data = self.sync(data['token'], limit=2)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(len(data['books']), 1)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.client.get('/sync/', {'since': 'abc'}).status_code, 400)
+
+    @override_settings(SYNC={'GAP_TIMEOUT': 30})
+    def test_entry_committed_below_the_token_is_not_skipped(self):
+        token = self.sync()['token']
+        top = ChangeLogEntry.objects.latest('id').id
+        # top + 1 belongs to a write still in flight when top + 2 commits
+        ChangeLogEntry.objects.create(id=top + 2, kind=ChangeLogEntry.BOOK, object_id=self.books[1].id)
+        data = self.sync(token)
+        self.assertEqual((data['books'], data['token'], data['has_more']), ([], token, False))
+
+        ChangeLogEntry.objects.create(id=top + 1, kind=ChangeLogEntry.BOOK, object_id=self.books[2].id)
+        data = self.sync(token)
+        self.assertEqual(sorted(row['id'] for row in data['books']), [self.books[1].id, self.books[2].id])
+        self.assertEqual(data['token'], str(top + 2))
+
+        # top + 3 never commits: once the entry above it is old enough, it is passed
+        ChangeLogEntry.objects.create(
+            id=top + 4, kind=ChangeLogEntry.BOOK, object_id=self.books[0].id,
+            created_at=timezone.now() - timedelta(minutes=1),
+        )
+        data = self.sync(data['token'])
+        self.assertEqual([row['id'] for row in data['books']], [self.books[0].id])
+        self.assertEqual(data['token'], str(top + 4))
+
+
+# Test cases for the live availability stream
+class LiveAvailabilityTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=2)
+
+    def test_broker_fans_out_and_bounds_queues(self):
+        async def scenario():
+            broker = LocalBroker(queue_size=2)
+            subscription = broker.subscribe({1, 2})
+            other = broker.subscribe({3})
+            # Publishers run on other threads
+            await sync_to_async(broker.publish, thread_sensitive=False)([{'id': 1, 'quantity': 0}])
+            self.assertEqual(await subscription.get(1), {'id': 1, 'quantity': 0})
+
+            # A client that falls behind gets one resync instead of an unbounded backlog
+            broker.publish([{'id': 2, 'quantity': quantity} for quantity in range(3)])
+            self.assertIs(await subscription.get(1), RESYNC)
+            self.assertTrue(subscription.queue.empty())
+            self.assertTrue(other.queue.empty())
+
+            broker.unsubscribe(subscription)
+            self.assertEqual(broker.watched({1, 2, 3}), {3})
+
+        async_to_sync(scenario)()
+
+    def borrow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/borrow/{self.book.id}/')
+
+    def test_stream_sends_snapshot_then_changes(self):
+        token = AccessToken.for_user(self.user)
+
+        async def scenario():
+            request = AsyncRequestFactory().get(
+                '/live/availability/', {'books': f'{self.book.id},999'}, headers={'Authorization': f'Bearer {token}'},
+            )
+            response = await availability_stream(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = response.streaming_content
+            self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+            snapshot = [json.loads((await anext(stream)).split(b'data: ')[1]) for _ in range(2)]
+            self.assertEqual(snapshot, [
+                {'id': self.book.id, 'quantity': 2, 'on_loan': 0},
+                {'id': 999, 'deleted': True},
+            ])
+
+            await sync_to_async(self.borrow)()
+            event = await anext(stream)
+            self.assertTrue(event.startswith(b'event: availability'))
+            self.assertEqual(json.loads(event.split(b'data: ')[1]), {'id': self.book.id, 'quantity': 1, 'on_loan': 1})
+
+            # The handler closes the wrapper and then the response, leaving the inner generator suspended
+            await stream.aclose()
+            self.assertEqual(get_broker().watched({self.book.id}), {self.book.id})
+            response.close()
+            self.assertEqual(get_broker().watched({self.book.id}), set())
+
+        async_to_sync(scenario)()
+
+    def test_closing_the_response_ends_a_waiting_stream(self):
+        token = AccessToken.for_user(self.user)
+
+        async def scenario():
+            request = AsyncRequestFactory().get(
+                '/live/availability/', {'books': self.book.id}, headers={'Authorization': f'Bearer {token}'},
+            )
+            response = await availability_stream(request)
+            stream = response.streaming_content
+            for _ in range(2):
+                await anext(stream)
+            waiting = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0)
+            # As the ASGI handler does, from a worker thread
+            await sync_to_async(response.close, thread_sensitive=False)()
+            with self.assertRaises(StopAsyncIteration):
+                await asyncio.wait_for(waiting, 5)
+            self.assertEqual(get_broker().watched({self.book.id}), set())
+
+        async_to_sync(scenario)()
+
+    def test_stream_requires_token_and_books(self):
+        async def scenario():
+            response = await availability_stream(AsyncRequestFactory().get('/live/availability/', {'books': '1'}))
+            self.assertEqual(response.status_code, 401)
+            token = AccessToken.for_user(self.user)
+            response = await availability_stream(
+                AsyncRequestFactory().get('/live/availability/', headers={'Authorization': f'Bearer {token}'})
+            )
+            self.assertEqual(response.status_code, 400)
+
+        async_to_sync(scenario)()
+
+
+# Test cases for the read-through object cache
+class ObjectCacheTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = [
+            Book.objects.create(title=f'Book {number}', author='Author', isbn=f'{number:013d}', quantity=2)
+            for number in range(3)
+        ]
+
+    def test_warm_lists_skip_the_join(self):
+        for book in self.books:
+            self.client.post(f'/borrow/{book.id}/')
+        first = self.client.get('/borrowed-books/?page_size=2')
+        # Only the ETag validators; the loans and their books are cached
+        with self.assertNumQueries(1):
+            second = self.client.get('/borrowed-books/?page_size=2')
+        self.assertEqual(second.data, first.data)
+        rest = self.client.get(f"/borrowed-books/?page_size=2&cursor={first.data['next_cursor']}")
+        ids = [row['book']['id'] for row in first.data['results'] + rest.data['results']]
+        self.assertEqual(sorted(ids), sorted(book.id for book in self.books))
+        self.assertFalse(rest.data['has_more'])
+        self.assertGreater(object_cache.stats['list_hits'], 0)
+
+    def test_writes_invalidate_rows_and_lists(self):
+        book = self.books[0]
+        self.client.post(f'/borrow/{book.id}/')
+        self.assertEqual(self.client.get('/borrowed-books/').data['results'][0]['book']['quantity'], 1)
+        self.client.post(f'/borrow/{book.id}/')
+        rows = self.client.get('/borrowed-books/').data['results']
+        self.assertEqual([row['book']['quantity'] for row in rows], [0, 0])
+
+        self.client.post(f'/favorite/{book.id}/')
+        self.assertEqual(len(self.client.get('/favorited-books/').data['results']), 1)
+        # Admin deletes go through the same invalidation
+        request = mock.Mock(user=User.objects.create_superuser(
+            user_name='admin', email='admin@example.com', password='admin123',
+        ))
+        admin.site._registry[Favorite].delete_model(request, Favorite.objects.get())
+        self.assertEqual(self.client.get('/favorited-books/').data['results'], [])
+
+    @override_settings(OBJECT_CACHE={'ALIAS': 'objects', 'MAX_LIST_LENGTH': 2})
+    def test_long_lists_are_paged_from_the_database(self):
+        for book in self.books:
+            self.client.post(f'/favorite/{book.id}/')
+        response = self.client.get('/favorited-books/')
+        self.assertEqual([row['book']['id'] for row in response.data['results']], [book.id for book in reversed(self.books)])
+        self.assertIsNone(object_cache.get_favorites(self.user.id))
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/cache/stats/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser(
+            user_name='admin', email='admin@example.com', password='admin123',
+        ))
+        self.client.get('/books/')
+        response = self.client.get('/cache/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['book_misses'], 3)
+
+
+# Test cases for the cached JWT authentication
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_warm_requests_skip_the_user_table(self):
+        self.assertEqual(self.client.get('/user/profile/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/user/profile/')
+        self.assertEqual(response.data['user_name'], 'reader')
+        # Only the serializer's group and permission lookups are left
+        self.assertEqual([query for query in queries if re.search(r'FROM [`"]library_app_customuser[`"]', query['sql'])], [])
+        self.assertEqual(object_cache.stats['user_hits'], 1)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.client.get('/user/profile/')
+        self.user.first_name = 'Janet'
+        self.user.save()
+        self.assertIsNone(object_cache.cache.get(user_key(self.user.id)))
+        self.assertEqual(self.client.get('/user/profile/').data['first_name'], 'Janet')
+
+    def test_deactivated_user_is_rejected_at_once(self):
+        self.client.get('/user/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/user/profile/').status_code, 401)
+
+    def test_cached_user_leaves_out_the_password_hash(self):
+        self.client.get('/user/profile/')
+        cached = object_cache.cache.get(user_key(self.user.id))
+        self.assertEqual(cached['user_name'], 'reader')
+        self.assertNotIn('password', cached)
+        self.assertNotIn(self.user.password, repr(cached))
+
+    def test_password_change_revokes_tokens_of_the_cached_user(self):
+        # simplejwt's modules bind api_settings at import, so override_settings cannot reach them
+        with mock.patch.object(jwt_tokens.api_settings, 'CHECK_REVOKE_TOKEN', True), \
+                mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.client.get('/user/profile/').status_code, 200)
+            self.assertEqual(self.client.get('/user/profile/').status_code, 200)
+            self.user.set_password('password456')
+            self.user.save()
+            self.assertEqual(self.client.get('/user/profile/').status_code, 401)
+
+
+# Test cases for the refresh-token blacklist prefilter and pruning
+@override_settings(TOKEN_BLACKLIST={'PREFILTER': True, 'ALIAS': 'default'})
+class TokenBlacklistTest(TestCase):
+    def setUp(self):
+        blacklist_filter.reset()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+
+    def blacklist_lookups(self, queries):
+        # The check_blacklist() query: blacklist rows joined to their token, looked up by jti
+        return [
+            query for query in queries
+            if re.search(r'blacklistedtoken\S* INNER JOIN .* WHERE \S*\."jti\S* = ', query['sql'])
+        ]
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add(f'jti-{number}')
+        self.assertTrue(all(f'jti-{number}' in bloom for number in range(1000)))
+        false_positives = sum(f'other-{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_fresh_refresh_skips_the_blacklist_query(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.blacklist_lookups(queries), [])
+
+        # The rotated token was blacklisted, so replaying it is checked and refused
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(self.blacklist_lookups(queries)), 1)
+
+    def test_other_workers_sync_after_commit(self):
+        other_worker = BlacklistFilter()
+        token = RefreshToken.for_user(self.user)
+        self.assertFalse(other_worker.might_contain(token['jti']))
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        self.assertTrue(other_worker.might_contain(token['jti']))
+        self.assertEqual(other_worker.stats['syncs'], 2)
+
+    def test_ids_committed_out_of_order_are_synced(self):
+        other_worker = BlacklistFilter()
+        first, second = (RefreshToken.for_user(self.user) for _ in range(2))
+        self.assertFalse(other_worker.might_contain(first['jti']))
+        outstanding = {
+            token['jti']: OutstandingToken.objects.get(jti=token['jti']) for token in (first, second)
+        }
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        # The higher id commits first; the lower one is still in flight during the sync
+        BlacklistedToken.objects.create(id=last_id + 2, token=outstanding[second['jti']])
+        blacklist_filter.publish()
+        self.assertTrue(other_worker.might_contain(second['jti']))
+        BlacklistedToken.objects.create(id=last_id + 1, token=outstanding[first['jti']])
+        blacklist_filter.publish()
+        self.assertTrue(other_worker.might_contain(first['jti']))
+
+    def test_prune_deletes_expired_tokens_in_batches(self):
+        now = timezone.now()
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(
+                user=self.user, jti=f'jti-{number}', token='', expires_at=now + timedelta(days=number - 3, hours=1),
+            )
+            for number in range(6)
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+        out = io.StringIO()
+        call_command('prune_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('Pruned 3 expired tokens.', out.getvalue())
+        self.assertEqual(
+            sorted(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-3', 'jti-4', 'jti-5'],
+        )
+        self.assertEqual(BlacklistedToken.objects.count(), 3)
+
+
+# Test cases for the lean list serialization path
+class BookRowsTest(TestCase):
+    def setUp(self):
+        cover = 'Images/BooksCover/art of war.jpg'
+        self.covered = Book.objects.create(
+            title='The Art of War', author='Sun Tzu', isbn='9780140449266', quantity=2, cover_image=cover,
+            cover_renditions={
+                'original': cover,
+                **{size: {'jpeg': f'Images/BooksCover/art of war.1.{size}.jpg', 'webp': f'Images/BooksCover/art of war.1.{size}.webp'}
+                   for size in ('small', 'medium', 'large')},
+            },
+        )
+        self.plain = Book.objects.create(title='ኦሮማይ', author='በዓሉ ግርማ', isbn='9789994400007')
+
+    def rendered(self, renderer, data):
+        return json.loads(renderer.render(data))
+
+    def test_rows_match_the_model_serializers(self):
+        rows = BookRows()
+        for book in (self.covered, self.plain):
+            book.refresh_from_db()
+            row = Book.objects.values(*BOOK_COLUMNS).get(pk=book.pk)
+            self.assertEqual(
+                self.rendered(FastJSONRenderer(), rows.full(row)),
+                self.rendered(JSONRenderer(), BookSerializer(book).data),
+            )
+            self.assertEqual(
+                self.rendered(FastJSONRenderer(), {'book': rows.embedded(row)}),
+                self.rendered(JSONRenderer(), BorrowedBookSerializer(Borrow(book=book)).data),
+            )
+        self.assertEqual(rows.full(row)['cover_image'], None)
+        self.assertEqual(
+            BookRows().full(Book.objects.values(*BOOK_COLUMNS).get(pk=self.covered.pk))['cover_images']['small']['webp'],
+            '/Media/Images/BooksCover/art%20of%20war.1.small.webp',
+        )
+
+    def test_renderer_output_and_fallback(self):
+        data = {'results': [{'title': 'ኦሮማይ', 'note': 'a\u2028b'}], 'next_cursor': None, 'has_more': False}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # Types only DRF's encoder knows fall back to it
+        dated = {'inserted_date': self.plain.inserted_date}
+        self.assertEqual(FastJSONRenderer().render(dated), JSONRenderer().render(dated))
+
+    def test_benchmark_command_runs(self):
+        out = io.StringIO()
+        call_command('benchmark', 'serializers', '--sizes', '20', '--repeat', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+# Query-plan regression tests for the hot per-user queries
+class QueryPlanTest(TestCase):
+    """
+    Calls each hot endpoint with a cold object cache, replays every statement
+    it ran under EXPLAIN, and fails on a full table scan or when the endpoint
+    goes over its query budget.
+    """
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'no plan check for {connection.vendor}')
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = Book.objects.bulk_create([
+            Book(title=f'Book {number}', author='Author', isbn=f'{number:013d}', quantity=5)
+            for number in range(20)
+        ])
+        today = timezone.now().date()
+        Borrow.objects.bulk_create([
+            Borrow(user=self.user, book=book, borrowed_date=today - timedelta(days=number),
+                   return_date=today if number % 2 else None)
+            for number, book in enumerate(self.books)
+        ])
+        Favorite.objects.bulk_create([Favorite(user=self.user, book=book) for book in self.books[:10]])
+        # bulk_create skips the views that keep on_loan and favorite_count
+        call_command('reconcile_book_counters', stdout=io.StringIO())
+
+    def full_scans(self, sql):
+        # The plan lines of `sql` that read a whole table
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would be scanned anyway; only a missing index should show
+                cursor.execute('SET enable_seqscan = off')
+                try:
+                    cursor.execute('EXPLAIN ' + sql)
+                    return [row[0] for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+                finally:
+                    cursor.execute('RESET enable_seqscan')
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [
+                row[-1] for row in cursor.fetchall()
+                if (match := re.match(r'SCAN (\w+)', row[-1])) and match.group(1) in tables
+            ]
+
+    def check(self, method, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 300, url)
+        statements = [
+            query['sql'] for query in queries
+            if query['sql'].split()[0] in ('SELECT', 'UPDATE', 'DELETE')
+        ]
+        self.assertLessEqual(len(statements), budget, f'{method.upper()} {url}: {statements}')
+        for sql in statements:
+            self.assertEqual(self.full_scans(sql), [], sql)
+
+    def test_loans_for_user_by_date(self):
+        self.check('get', '/borrowed-books/', 3)
+        # A history too long for the object cache is paged from the database
+        with override_settings(OBJECT_CACHE={'ALIAS': 'objects', 'MAX_LIST_LENGTH': 5}):
+            object_cache.clear()
+            self.check('get', '/borrowed-books/?page_size=5', 4)
+
+    def test_open_loans_for_book(self):
+        self.check('post', f'/return/{self.books[0].id}/', 3)
+        self.check('post', f'/borrow/{self.books[1].id}/', 1)
+
+    def test_favorites_for_user(self):
+        self.check('get', '/favorited-books/', 3)
+        self.check('post', f'/favorite/{self.books[0].id}/', 2)
+        self.check('post', f'/favorite/{self.books[15].id}/', 2)
+
+
+# Test cases for the statistics rollups
+class StatsTest(TestCase):
+    def setUp(self):
+        object_cache.clear()
+        self.user = User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123',
+            first_name='Jane', last_name='Doe',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = [
+            Book.objects.create(title=f'Book {number}', author='Author', isbn=f'{number:013d}', quantity=3)
+            for number in range(3)
+        ]
+
+    def rollups(self, period):
+        # Per bucket, summed over the library shards
+        return sorted(
+            LibraryActivity.objects.filter(period=period).values_list('bucket')
+            .annotate(Sum('borrows'), Sum('returns'), Sum('favorites_added'), Sum('new_books')).order_by()
+        )
+
+    def book_rollups(self, period):
+        return sorted(BookActivity.objects.filter(period=period).values_list('bucket', 'book', 'borrows', 'returns'))
+
+    def test_write_paths_feed_the_stats(self):
+        for _ in range(2):
+            self.client.post(f'/borrow/{self.books[1].id}/')
+        self.client.post(f'/borrow/{self.books[0].id}/')
+        self.client.post(f'/return/{self.books[1].id}/')
+        self.client.post(f'/favorite/{self.books[2].id}/')
+
+        # Totals, series, popular, the popular books and the caller's loans
+        object_cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get('/stats/?period=hour&buckets=3&top=2')
+        self.assertEqual(response.status_code, 200)
+        totals = response.data['totals']
+        self.assertEqual(
+            (totals['borrows'], totals['returns'], totals['active_loans'], totals['favorites_added'], totals['new_books']),
+            (3, 1, 2, 1, 3),
+        )
+        series = response.data['series']
+        self.assertEqual(len(series), 3)
+        self.assertEqual((series[-1]['borrows'], series[-1]['active_loans']), (3, 2))
+        self.assertEqual(series[0]['active_loans'], 0)
+        self.assertEqual(
+            [(row['book']['id'], row['borrows']) for row in response.data['popular']],
+            [(self.books[1].id, 2), (self.books[0].id, 1)],
+        )
+        self.assertEqual(response.data['user'], {'borrows': 3, 'returns': 1})
+
+    def test_rebuild_matches_live_counting(self):
+        self.client.post(f'/borrow/{self.books[0].id}/')
+        self.client.post(f'/borrow/{self.books[1].id}/')
+        self.client.post(f'/return/{self.books[0].id}/')
+        self.client.post(f'/favorite/{self.books[2].id}/')
+        periods = ('hour', 'day', 'all')
+        live = [self.rollups(period) for period in periods]
+        live_books = [self.book_rollups(period) for period in periods]
+        call_command('rebuild_stats', stdout=io.StringIO())
+        # Hourly loans and dated favorites cannot be recomputed, so they are kept
+        self.assertEqual([self.rollups(period) for period in periods], live)
+        self.assertEqual([self.book_rollups(period) for period in periods], live_books)
+        response = self.client.get('/stats/?period=hour&buckets=1')
+        self.assertEqual((response.data['series'][0]['borrows'], response.data['series'][0]['returns']), (2, 1))
+        self.assertEqual(response.data['popular'][0]['borrows'], 1)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/stats/?period=week').status_code, 400)
+        self.assertEqual(self.client.get('/stats/?buckets=1000').status_code, 400)
+
+
+# Test cases for the per-endpoint metrics
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.clear()
+        object_cache.clear()
+        self.admin = User.objects.create_superuser(user_name='admin', email='admin@example.com', password='admin123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        Book.objects.create(title='Oromay', author='Bealu Girma', isbn='9789994400007', quantity=2)
+
+    def metrics(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_time_queries_and_bytes_per_url_name(self):
+        response = self.client.get('/books/')
+        text = self.metrics()
+        self.assertIn('library_request_duration_seconds_count{method="GET",view="books"} 1', text)
+        # ETag validators, the page's sort keys, then the uncached rows
+        self.assertIn('library_db_queries_sum{method="GET",view="books"} 3', text)
+        self.assertIn(f'library_response_bytes_sum{{method="GET",view="books"}} {len(response.content)}', text)
+        self.assertIn('library_db_queries_bucket{method="GET",view="books",le="+Inf"} 1', text)
+
+    def test_counts_google_books_calls(self):
+        # An ISBN no other test looks up, so the process-wide lookup cache is cold
+        with StubGoogleBooksServer({'9781000000187': {'title': 'Metrics'}}) as server, \
+                override_settings(GOOGLE_BOOKS={'API_URL': server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0}):
+            response = self.client.post('/books/add/', {'isbn': '9781000000187'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('library_http_requests_sum{method="POST",view="add-book"} 1', self.metrics())
+
+    async def test_records_asgi_requests_without_a_thread_hop(self):
+        async def get_response(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+
+        token = AccessToken.for_user(self.admin)
+        response = await AsyncClient().get('/books/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        text = await sync_to_async(self.metrics)()
+        self.assertIn('library_request_duration_seconds_count{method="GET",view="books"} 1', text)
+        # The token's user, then the same three queries as under WSGI
+        self.assertIn('library_db_queries_sum{method="GET",view="books"} 4', text)
+
+    @override_settings(METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get('/books/')
+        self.assertNotIn('view="books"', self.metrics())
+
+    def test_metrics_are_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            user_name='reader', email='reader@example.com', password='password123', first_name='Jane', last_name='Doe',
+        ))
+        self.assertEqual(client.get('/metrics/').status_code, 403)
+
+
+# Test cases for the load-test suite
+class LoadTestTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('in-memory SQLite locks whole tables against concurrent writers')
+
+    def test_drives_every_endpoint(self):
+        out = io.StringIO()
+        with StubGoogleBooksServer() as server, override_settings(GOOGLE_BOOKS={
+            'API_URL': server.url, 'MAX_RETRIES': 0, 'RATE_LIMIT': 0,
+        }):
+            results = run([30], threads=2, requests_per_thread=3, users=4, write=out.write)
+        self.assertEqual(set(results['30']), {
+            'books', 'search', 'search-isbn', 'borrow', 'favorite', 'borrowed-books', 'favorited-books',
+        })
+        for summary in results['30'].values():
+            self.assertEqual((summary['requests'], summary['errors']), (6, 0))
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        self.assertEqual(Book.objects.count(), 30)
+        self.assertEqual(User.objects.filter(user_name__startswith='load').count(), 4)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'1000': {'books': {'p95_ms': 10.0, 'queries_mean': 3.0}}}
+        self.assertEqual(compare({'1000': {'books': {'p95_ms': 11.0, 'queries_mean': 3.0}}}, baseline, 0.2), [])
+        self.assertEqual(
+            compare({'1000': {'books': {'p95_ms': 13.0, 'queries_mean': 4.0}}}, baseline, 0.2),
+            ['1000 books: p95 10.0 -> 13.0 ms', '1000 books: queries 3.0 -> 4.0'],
+        )
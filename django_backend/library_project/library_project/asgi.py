@@ -2,6 +2,9 @@
 ASGI config for library_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn library_project.asgi:application``)
+for the streaming /live/availability/ endpoint; under WSGI the stream would
+hold a worker thread per client.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
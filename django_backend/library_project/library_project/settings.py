@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware", # Added cors midleware
@@ -61,8 +62,15 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        # JWTAuthentication with the user read through the object cache
+        'library_app.api.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'library_app.api.pagination.KeysetPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'library_app.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'PAGE_SIZE': 20,
 }
 
 SIMPLE_JWT = {
@@ -98,13 +106,96 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "library_app.api.token_blacklist.FilteredTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
-    "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
+    "TOKEN_BLACKLIST_SERIALIZER": "library_app.api.token_blacklist.FilteredTokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+GOOGLE_BOOKS = {
+    "API_URL": os.environ.get("GOOGLE_BOOKS_API_URL", "https://www.googleapis.com/books/v1/volumes"),
+    "TIMEOUT": 5,
+    "CONNECT_TIMEOUT": 3.05,
+    "POOL_SIZE": 10,
+    "BATCH_SIZE": 10,
+    "BREAKER_THRESHOLD": 5,
+    "BREAKER_RESET": 30,
+    "CACHE_TTL": timedelta(days=7),
+    "NEGATIVE_CACHE_TTL": timedelta(days=1),
+    "STALE_TTL": timedelta(days=30),
+    "LRU_SIZE": 2048,
+}
+
+# Live availability stream (/live/availability/), served over ASGI
+LIVE_UPDATES = {
+    # In-process fan-out; a backend shared between workers has the same interface
+    "BACKEND": "library_app.api.live.LocalBroker",
+    "QUEUE_SIZE": 100,
+    "MAX_BOOKS": 200,
+    "HEARTBEAT": 15,
+    "MAX_DURATION": 300,
+}
+
+# Per-endpoint histograms served at /metrics/ (library_app.middleware.MetricsMiddleware)
+METRICS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": float(os.environ.get("METRICS_SAMPLE_RATE", "1.0")),
+}
+
+# Statistics rollups served at /stats/ (library_app.api.stats)
+STATS = {
+    "SHARDS": 16,
+}
+
+# Delta sync at /sync/ (library_app.api.changes): seconds a missing change log
+# id holds the token back before it counts as a rolled-back write
+SYNC = {
+    "GAP_TIMEOUT": 30,
+}
+
+# Caches: local memory per process in development, Redis shared by every
+# worker when REDIS_URL is set (its size limit is the server's maxmemory)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    },
+    "objects": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "objects",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["objects"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+        "TIMEOUT": 300,
+        "KEY_PREFIX": "library",
+    }
+
+# Read-through cache of Book rows and per-user lists (library_app.api.object_cache)
+OBJECT_CACHE = {
+    "ALIAS": "objects",
+    "BOOK_TTL": 300,
+    "LIST_TTL": 120,
+    "MAX_LIST_LENGTH": 1000,
+    "USER_TTL": 60,
+}
+
+# Bloom-filter prefilter in front of the refresh-token blacklist check
+# (library_app.api.token_blacklist); it needs a cache shared by every worker.
+# Expired tokens are deleted by `manage.py prune_tokens`, run on a schedule
+TOKEN_BLACKLIST = {
+    "PREFILTER": bool(os.environ.get("REDIS_URL")),
+    "ALIAS": "objects",
+    "CAPACITY": 1000000,
+    "ERROR_RATE": 0.001,
+    "GAP_TIMEOUT": 600,
+}
+
 ROOT_URLCONF = 'library_project.urls'
 
 TEMPLATES = [